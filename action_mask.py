@@ -0,0 +1,205 @@
+import math
+import numpy as np
+
+from angle_intervals import AngleIntervals
+from trajectory import sweep_hits_rects
+from settings import SCREEN_WIDTH, FPS
+
+# the ball may not leave the screen by more than this margin
+WALL_MARGIN = 25
+
+# bisection steps used to place a platform interval boundary between two grid angles
+REFINE_STEPS = 12
+
+def compute_action_mask(ball, new_platform, platform_index, frame_data, time_to_project=None, resolution=360):
+    """
+    Batched replacement for the per-angle loop in GameStateManager.get_action_mask.
+
+    An angle is masked out if its bounce path leaves the screen or sweeps into
+    a placed platform before the next note, or if the new platform at that
+    angle would overlap any previous ball position.
+
+    :param ball: The paused ball the new platform is attached to.
+    :param new_platform: The platform being placed, only its size is used.
+    :param platform_index: PlatformIndex of the platforms already in the level.
+    :param frame_data: TrailStore of previous ball positions, normally ending with the current one.
+    :param time_to_project: Seconds until the next note, None if this is the last note.
+    :param resolution: Number of evenly spaced angles in the mask, 360 for whole degrees.
+    :return: (mask, forbidden) where mask is an int array with 1 for every allowed angle
+             and forbidden is the AngleIntervals it was sampled from.
+    """
+    # whole-degree masks only sample the platform grid, finer ones need its boundaries refined
+    refine_steps = 0 if 360 % resolution == 0 else REFINE_STEPS
+    forbidden = forbidden_angles(ball, new_platform, platform_index, frame_data, time_to_project=time_to_project,
+                                 refine_steps=refine_steps)
+    return forbidden.to_mask(resolution), forbidden
+
+def forbidden_angles(ball, new_platform, platform_index, frame_data, time_to_project=None, refine_steps=REFINE_STEPS):
+    """
+    Every platform angle that is not allowed, as the union of the angular
+    intervals ruled out by each obstacle: the screen edges, the placed
+    platforms and the nearby part of the ball's trail.
+
+    Screen edge and trail intervals are exact. Platform intervals come from a
+    whole-degree grid whose boundaries are bisected refine_steps times.
+    """
+    forbidden = AngleIntervals()
+
+    if time_to_project is not None:
+        _add_wall_intervals(forbidden, ball, time_to_project * FPS)
+        if len(platform_index):
+            _add_platform_intervals(forbidden, ball, platform_index, time_to_project, refine_steps)
+
+    _add_trail_intervals(forbidden, ball, new_platform.length, new_platform.width, frame_data)
+    return forbidden
+
+def _bounce_direction(ball):
+    # a platform at angle a sends the ball off at speed S in direction
+    # psi = 2a - incoming, velocity S * (-cos psi, sin psi); see Ball.bounce_velocity
+    incoming = math.degrees(math.atan2(-ball.prev_velocity[1], ball.prev_velocity[0]))
+    speed = math.sqrt(ball.prev_velocity[0] ** 2 + ball.prev_velocity[1] ** 2) * ball.restitution
+    return incoming, speed
+
+def _add_psi_intervals(forbidden, incoming, starts, ends):
+    # psi and psi + 360 are the same direction, so each psi interval rules out
+    # two platform angle intervals half a turn apart
+    starts = (np.asarray(starts) + incoming) / 2
+    ends = (np.asarray(ends) + incoming) / 2
+    forbidden.add(starts, ends)
+    forbidden.add(starts + 180, ends + 180)
+
+def _add_wall_intervals(forbidden, ball, duration):
+    # gravity is vertical, so the final x is x0 - S*T*cos(psi) and the path stays
+    # on screen exactly when cos(psi) lies between two bounds
+    incoming, speed = _bounce_direction(ball)
+    low_x, high_x = WALL_MARGIN, SCREEN_WIDTH - WALL_MARGIN
+    if not low_x <= ball.x <= high_x:
+        forbidden.add_all()
+        return
+    reach = speed * duration
+    if reach == 0:
+        return
+
+    # leaves through the left edge when cos(psi) > upper
+    upper = (ball.x - low_x) / reach
+    if upper < 1:
+        half = math.degrees(math.acos(max(upper, -1)))
+        _add_psi_intervals(forbidden, incoming, -half, half)
+
+    # leaves through the right edge when cos(psi) < lower
+    lower = (ball.x - high_x) / reach
+    if lower > -1:
+        half = math.degrees(math.acos(min(lower, 1)))
+        _add_psi_intervals(forbidden, incoming, half, 360 - half)
+
+def _add_platform_intervals(forbidden, ball, platform_index, time_to_project, refine_steps):
+    # The path only depends on 2a, so half a turn of whole degrees covers every
+    # trajectory. The exact sweep is evaluated on that grid and every boundary
+    # between a hit and a miss is then refined by bisection; a blocked range
+    # narrower than one degree that falls between grid angles is not seen.
+    grid = np.arange(180, dtype=float)
+    paths = ball.bounce_path(grid, total_time=time_to_project)
+
+    bounds = paths.bounds()
+    bounds[:, :2] -= ball.radius
+    bounds[:, 2:] += ball.radius
+    ids = platform_index.query(*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0))
+    if len(ids) == 0:
+        return
+    rects = platform_index.rects(ids)
+
+    # broadphase: only the (angle, platform) pairs whose bounding boxes overlap
+    platform_bounds = platform_index.bounds(ids)
+    overlap = ((bounds[:, None, 0] <= platform_bounds[:, 2]) & (bounds[:, None, 2] >= platform_bounds[:, 0]) &
+               (bounds[:, None, 1] <= platform_bounds[:, 3]) & (bounds[:, None, 3] >= platform_bounds[:, 1]))
+    angle_ids, candidate_ids = np.nonzero(overlap)
+    centers, normals, tangents, lengths, widths = (part[candidate_ids] for part in rects)
+    hits = sweep_hits_rects(paths.origin, paths.velocity[angle_ids], paths.acceleration, paths.duration,
+                            centers, normals, tangents, lengths, widths, ball.radius)
+    blocked = np.zeros(len(grid), dtype=bool)
+    blocked[angle_ids[hits]] = True
+    if not blocked.any():
+        return
+    if blocked.all():
+        forbidden.add_all()
+        return
+
+    def blocked_at(angles):
+        paths = ball.bounce_path(angles, total_time=time_to_project)
+        return paths.hits_rects(*rects, ball.radius).any(axis=-1)
+
+    def refine(free_side, blocked_side):
+        for _ in range(refine_steps):
+            middle = (free_side + blocked_side) / 2
+            hit = blocked_at(middle)
+            blocked_side = np.where(hit, middle, blocked_side)
+            free_side = np.where(hit, free_side, middle)
+        return blocked_side
+
+    # runs of blocked grid angles, cyclic with period 180; each run starts
+    # between a free angle and the next one and ends the other way round
+    following = np.roll(blocked, -1)
+    rises = grid[~blocked & following]
+    falls = grid[blocked & ~following]
+    starts = refine(rises, rises + 1)
+    ends = np.sort(refine(falls + 1, falls))
+
+    # pair every run start with the first run end after it
+    ends = ends[np.searchsorted(ends, starts) % len(ends)]
+    ends = np.where(ends < starts, ends + 180, ends)
+    forbidden.add(starts, ends)
+    forbidden.add(starts + 180, ends + 180)
+
+def _add_trail_intervals(forbidden, ball, length, width, frame_data):
+    # previous ball positions close enough to touch the new platform at some angle
+    reach = np.hypot(ball.radius + width, length / 2) + ball.radius
+    # the last sample is normally the current position, which the platform
+    # always touches; a decimated trail may not have recorded it
+    stop = len(frame_data)
+    if stop and frame_data[-1][0] == ball.x and frame_data[-1][1] == ball.y:
+        stop -= 1
+    ids = frame_data.query_radius(ball.x, ball.y, reach, stop=stop)
+    if len(ids) == 0:
+        return
+
+    # polar coordinates of each sample around the ball, with angles measured
+    # like platform angles (counterclockwise, screen y pointing down)
+    offsets = frame_data.positions()[ids] - (ball.x, ball.y)
+    distance = np.hypot(offsets[:, 0], offsets[:, 1])[:, None]
+    bearing = np.degrees(np.arctan2(-offsets[:, 1], offsets[:, 0]))[:, None]
+
+    # Seen from a platform at angle a, a sample at bearing b sits at angle
+    # theta = b - a, and the platform covers s in [r, r + width], |w| <= length/2.
+    # The sample is too close when it lies in that rectangle grown by the ball
+    # radius, and the circle at the sample's distance can only enter or leave the
+    # grown rectangle where it crosses one of its four sides or four corner arcs.
+    radius = ball.radius
+    with np.errstate(divide='ignore', invalid='ignore'):
+        candidates = []
+        for side in (0, 2 * radius + width):
+            half = np.degrees(np.arccos(side / distance))
+            candidates += [half, -half]
+        for side in (length / 2 + radius, -(length / 2 + radius)):
+            crossing = np.degrees(np.arcsin(side / distance))
+            candidates += [crossing, 180 - crossing]
+        for corner_s in (radius, radius + width):
+            for corner_w in (length / 2, -length / 2):
+                corner_distance = math.hypot(corner_s, corner_w)
+                corner_bearing = math.degrees(math.atan2(corner_w, corner_s))
+                spread = np.degrees(np.arccos((distance ** 2 + corner_distance ** 2 - radius ** 2) / (2 * distance * corner_distance)))
+                candidates += [corner_bearing + spread, corner_bearing - spread]
+
+    # sort the crossings around the circle and keep the arcs between them that
+    # lie inside the grown rectangle
+    crossings = np.nan_to_num(np.mod(np.concatenate(candidates, axis=1), 360))
+    crossings = np.sort(np.concatenate([crossings, np.zeros_like(distance), np.full_like(distance, 360)], axis=1), axis=1)
+    lows, highs = crossings[:, :-1], crossings[:, 1:]
+    middle = np.radians((lows + highs) / 2)
+    along = distance * np.cos(middle) - (radius + width / 2)
+    across = distance * np.sin(middle)
+    inside = np.hypot(np.maximum(np.abs(along) - width / 2, 0), np.maximum(np.abs(across) - length / 2, 0)) <= radius
+    inside &= highs > lows
+
+    # theta in [low, high] rules out platform angles a = b - theta in [b - high, b - low]
+    bearing = np.broadcast_to(bearing, lows.shape)
+    forbidden.add(bearing[inside] - highs[inside], bearing[inside] - lows[inside])
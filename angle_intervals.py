@@ -0,0 +1,85 @@
+import numpy as np
+
+class AngleIntervals:
+    """
+    A union of closed angular intervals, in degrees on the circle [0, 360).
+
+    Intervals can be added in any order, may wrap past 360 and may overlap;
+    they are merged lazily the first time the set is queried.
+    """
+    def __init__(self):
+        self._starts = []
+        self._ends = []
+        self._merged = (np.empty(0), np.empty(0))
+        self._dirty = False
+
+    def add(self, starts, ends):
+        """
+        Add the intervals [starts[i], ends[i]]; ends are measured counterclockwise
+        from starts, so [350, 370] covers 350..360 and 0..10.
+        """
+        starts, ends = np.broadcast_arrays(np.asarray(starts, dtype=float), np.asarray(ends, dtype=float))
+        starts, ends = starts.ravel(), ends.ravel()
+        lengths = ends - starts
+        keep = lengths >= 0
+        starts, lengths = np.mod(starts[keep], 360), lengths[keep]
+
+        # a full turn or more covers everything
+        full = lengths >= 360
+        starts[full], lengths[full] = 0, 360
+
+        # split the ones that wrap past 360
+        ends = starts + lengths
+        wraps = ends > 360
+        self._starts += [starts, np.zeros(np.count_nonzero(wraps))]
+        self._ends += [np.minimum(ends, 360), ends[wraps] - 360]
+        self._dirty = True
+
+    def add_all(self):
+        self.add(0, 360)
+
+    def intervals(self):
+        """
+        (starts, ends) arrays of the sorted, disjoint intervals making up the set.
+        """
+        if self._dirty:
+            starts = np.concatenate(self._starts)
+            ends = np.concatenate(self._ends)
+            order = np.argsort(starts)
+            starts, ends = starts[order], ends[order]
+
+            # a new run starts wherever an interval begins after every earlier one ended
+            reach = np.maximum.accumulate(ends)
+            new_run = np.ones(len(starts), dtype=bool)
+            new_run[1:] = starts[1:] > reach[:-1]
+            run_ids = np.cumsum(new_run) - 1
+            merged_ends = np.full(np.count_nonzero(new_run), -np.inf)
+            np.maximum.at(merged_ends, run_ids, ends)
+            self._merged = (starts[new_run], merged_ends)
+            self._starts, self._ends = [self._merged[0]], [self._merged[1]]
+            self._dirty = False
+        return self._merged
+
+    def contains(self, angles):
+        """
+        Boolean array, True for every angle inside the set.
+        """
+        starts, ends = self.intervals()
+        angles = np.mod(np.asarray(angles, dtype=float), 360)
+        if len(starts) == 0:
+            return np.zeros(angles.shape, dtype=bool)
+        index = np.searchsorted(starts, angles, side='right') - 1
+        inside = (index >= 0) & (angles <= ends[np.maximum(index, 0)])
+        # the point 360 == 0 closes intervals ending at 360
+        return inside | ((angles == 0) & (ends[-1] >= 360))
+
+    def measure(self):
+        starts, ends = self.intervals()
+        return float(np.sum(ends - starts))
+
+    def to_mask(self, resolution=360):
+        """
+        Action mask with resolution evenly spaced angles starting at 0: 1 where the
+        angle is outside the set.
+        """
+        return (~self.contains(np.arange(resolution) * (360 / resolution))).astype(int)
@@ -1,11 +1,26 @@
 import pygame
 import pygame.midi
+import heapq
 import mido
+import threading
 import time
+from array import array
+from operator import itemgetter
 
+import numpy as np
+
+from note_schedule import NoteSchedule
+from schedule_cache import ScheduleCache
+
+# parsed schedules shared by every reset in this process
+schedule_cache = ScheduleCache()
+
+# safe to call on every reset, the mixer and midi are only started once
 def init():
-    pygame.mixer.init()
-    pygame.midi.init()
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+    if not pygame.midi.get_init():
+        pygame.midi.init()
 
 def play(file_path):
     pygame.mixer.music.load(file_path)
@@ -24,131 +39,198 @@ def play(file_path):
 #             event = pygame.event.Event(custom_event, note=msg.note, velocity=msg.velocity)
 #             pygame.event.post(event)
 
-def pause_playback(controls):
+def _wake(controls):
+    # cut the note scheduler's sleep short, if one is running
+    wake = controls.get("wake")
+    if wake is not None:
+        wake.set()
+
+# clock is anything with a time() method, the time module itself by default
+def pause_playback(controls, clock=time):
     controls["pause"].set()
-    pygame.mixer.music.pause()
-    controls["pause_start_time"] = time.time()
+    _wake(controls)
+    if pygame.mixer.get_init():
+        pygame.mixer.music.pause()
+    controls["pause_start_time"] = clock.time()
 
-def resume_playback(controls):
+def resume_playback(controls, clock=time):
     controls["pause"].clear()
-    pygame.mixer.music.unpause()
-    pause_duration = time.time() - controls["pause_start_time"]
+    _wake(controls)
+    if pygame.mixer.get_init():
+        pygame.mixer.music.unpause()
+    pause_duration = clock.time() - controls["pause_start_time"]
     controls["total_paused_duration"] += pause_duration
 
 def stop_playback(controls):
     controls["stop"].set()
-
-def create_global_event_queue(midi_file_path):
-    # Load the MIDI file
+    _wake(controls)
+
+# the NoteSchedule of a MIDI file; read-only and shared, walk it with a cursor
+def create_global_event_queue(midi_file_path, tolerance=0.01, use_cache=True):
+    if not use_cache:
+        return parse_global_event_queue(midi_file_path, tolerance)
+    return schedule_cache.get(midi_file_path, tolerance, parse_global_event_queue)
+
+# microseconds per beat until the first set_tempo (120 bpm)
+DEFAULT_TEMPO = 500000
+
+def tempo_map(tempo_changes, ticks_per_beat):
+    """
+    The piecewise-linear tick to seconds mapping of a song.
+
+    :param tempo_changes: (tick, microseconds per beat) of every set_tempo in
+                          any track; a later change at the same tick wins.
+    :return: (ticks, seconds, scales) arrays: the tick each tempo starts at, the
+             seconds at that tick and the seconds per tick from there on.
+    """
+    changes = {0: DEFAULT_TEMPO}
+    for tick, tempo in sorted(tempo_changes, key=itemgetter(0)):
+        changes[tick] = tempo
+    ticks = np.array(sorted(changes), dtype=np.int64)
+    # same arithmetic as mido.tick2second
+    scales = np.array([changes[tick] * 1e-6 / ticks_per_beat for tick in ticks.tolist()])
+    seconds = np.zeros(len(ticks))
+    seconds[1:] = np.cumsum(np.diff(ticks) * scales[:-1])
+    return ticks, seconds, scales
+
+def ticks_to_seconds(ticks, tempo_map):
+    # every tick through the tempo segment it falls in, all at once
+    segment_ticks, segment_seconds, scales = tempo_map
+    segment = np.searchsorted(segment_ticks, ticks, side='right') - 1
+    return segment_seconds[segment] + (ticks - segment_ticks[segment]) * scales[segment]
+
+def parse_global_event_queue(midi_file_path, tolerance=0.01):
+    """
+    Read the note_on events of every track into a NoteSchedule, notes less
+    than tolerance seconds after the first note of a group joining the group.
+
+    Ticks are converted with one tempo map built from all tracks, so tempo
+    changes apply to every track at the tick they happen. Each track's notes
+    are already in order and are merged with a k-way heap merge; ties keep the
+    order of the tracks.
+    """
     midi_file = mido.MidiFile(midi_file_path)
 
-    # Default tempo: 500,000 microseconds per beat (120 bpm)
-    default_tempo = 500000
-    ticks_per_beat = midi_file.ticks_per_beat
-    current_tempo = default_tempo  # Start with the default tempo
-    
-    # This variable will hold the global event queue.
-    global_event_queue = []
-    
-    # Calculate absolute times for events in seconds and sort them
-    absolute_time_in_seconds = 0.0
-    
+    tempo_changes = []
+    tracks = []
     for track in midi_file.tracks:
         elapsed_ticks = 0
+        notes = []
         for msg in track:
-            # Update elapsed time with current message's delta time
             elapsed_ticks += msg.time
-            
-            # If the message is a tempo change, update the current tempo
             if msg.type == 'set_tempo':
-                current_tempo = msg.tempo
-            
-            # Convert ticks to seconds (for the current segment)
-            elapsed_seconds = mido.tick2second(elapsed_ticks, ticks_per_beat, current_tempo)
-            
-            if not msg.is_meta and msg.type == 'note_on' and msg.velocity > 0:
-                # Store the event with the absolute time in seconds
-                global_event_queue.append((absolute_time_in_seconds + elapsed_seconds, msg))
-    
-    # Sort the global event queue by time in seconds
-    global_event_queue.sort(key=lambda x: x[0])
-    
-    # Now, group events that occur at the same time
-    processed_queue = []
-    current_time = None
-    current_events = []
-    tolerance = 0.01  # Tolerance for grouping events that occur at the same time
-    for time, msg in global_event_queue:
-        if current_time is None or abs(time - current_time) > tolerance:
-            if current_events:
-                processed_queue.append((current_time, current_events))
-            current_time = time
-            current_events = [msg]
-        else:
-            current_events.append(msg)
-    
-    # Don't forget the last set of events
-    if current_events:
-        processed_queue.append((current_time, current_events))
-    
-    return processed_queue
+                tempo_changes.append((elapsed_ticks, msg.tempo))
+            elif msg.type == 'note_on' and msg.velocity > 0:
+                notes.append((elapsed_ticks, msg.channel, msg.note, msg.velocity))
+        tracks.append(notes)
 
-def trigger_builder_events(event_queue, wav_file_path, custom_event, controls):
-    start_time = time.time()  # Get the current time to use as the start time
+    # (tick, channel, note, velocity) rows in time order
+    notes = np.array(list(heapq.merge(*tracks, key=itemgetter(0))), dtype=np.int64).reshape(-1, 4)
+    times = ticks_to_seconds(notes[:, 0], tempo_map(tempo_changes, midi_file.ticks_per_beat))
 
+    # group notes that sound at the same time, within tolerance of the group's first
+    starts = []
+    current_time = None
+    for i, onset in enumerate(times.tolist()):
+        if current_time is None or abs(onset - current_time) > tolerance:
+            starts.append(i)
+            current_time = onset
+
+    return NoteSchedule(times[starts], starts + [len(notes)], notes[:, 2], notes[:, 3], notes[:, 1])
+
+# the scheduler sleeps until this long before a note is due, then yields
+# the CPU in a tight loop for the rest, sleeping alone can overshoot by a
+# millisecond or more
+SPIN_TIME = 0.001
+
+class NoteScheduler:
+    """
+    Posts custom_event for every chord of a NoteSchedule when it is due, on a
+    monotonic clock.
+
+    Between notes the thread sleeps until the next deadline, and a "wake"
+    Event added to controls cuts the sleep short as soon as pause_playback,
+    resume_playback or stop_playback is called. Time spent paused is measured
+    on the same clock and pushes the remaining deadlines back.
+
+    :param schedule: NoteSchedule to play.
+    :param custom_event: pygame event type to post, with the first note's note and velocity.
+    :param controls: Playback controls shared with the game.
+    :param clock: Monotonic clock in seconds.
+    """
+    def __init__(self, schedule, custom_event, controls, clock=time.monotonic):
+        self.schedule = schedule
+        self.custom_event = custom_event
+        self.controls = controls
+        self.clock = clock
+        self.cursor = schedule.cursor()
+        # seconds between each note's deadline and its post
+        self.lateness = array('d')
+        self._wake = controls.setdefault("wake", threading.Event())
+
+    def run(self):
+        controls = self.controls
+        cursor = self.cursor
+        start = self.clock()
+        paused = 0.0
+        while not cursor.done and not controls["stop"].is_set():
+            self._wake.clear()
+            if controls["pause"].is_set():
+                pause_start = self.clock()
+                while controls["pause"].is_set() and not controls["stop"].is_set():
+                    self._wake.wait()
+                    self._wake.clear()
+                paused += self.clock() - pause_start
+                continue
+
+            due = start + paused + cursor.time
+            remaining = due - self.clock()
+            if remaining > SPIN_TIME:
+                # woken early by a signal or not, check again
+                self._wake.wait(remaining - SPIN_TIME)
+                continue
+            now = self.clock()
+            while now < due:
+                time.sleep(0)
+                now = self.clock()
+            self._post(now - start - paused, now - due)
+
+        # now cleanup and switch state
+        stop_playback(controls)
+
+    def stats(self):
+        """
+        Lateness of the notes posted so far, in seconds.
+
+        :return: Dict with count, mean, max and p99.
+        """
+        if not self.lateness:
+            return {"count": 0, "mean": 0.0, "max": 0.0, "p99": 0.0}
+        lateness = np.frombuffer(self.lateness, dtype=np.float64)
+        return {
+            "count": len(lateness),
+            "mean": float(lateness.mean()),
+            "max": float(lateness.max()),
+            "p99": float(np.percentile(lateness, 99)),
+        }
+
+    def _post(self, current_time, lateness):
+        note, velocity = self.schedule.first_note(self.cursor.position)
+        self.cursor.advance()
+        self.lateness.append(lateness)
+
+        self.controls["time_until_next"] = 0
+        if not self.cursor.done:
+            self.controls["time_until_next"] = self.cursor.time - current_time
+
+        pygame.event.post(pygame.event.Event(self.custom_event, note=note, velocity=velocity))
+
+def trigger_builder_events(schedule, wav_file_path, custom_event, controls):
     play(wav_file_path)
+    # kept in controls so the game can read the lateness stats afterwards
+    controls["scheduler"] = NoteScheduler(schedule, custom_event, controls)
+    controls["scheduler"].run()
 
-    while event_queue:
-         # Check if the playback is paused
-        while controls["pause"].is_set():
-            time.sleep(0.01)  # Sleep for a short duration to reduce CPU usage during pause
-
-        # Calculate elapsed time, account for pause duration
-        current_time = time.time() - start_time - controls["total_paused_duration"]
-
-        print(f"Current time: {current_time}, Start time: {start_time}, Total paused duration: {controls['total_paused_duration']}")
-
-        # Check if the first event in the queue is due to be triggered
-        if event_queue[0][0] <= current_time:
-            _, events_to_trigger = event_queue.pop(0)  # Remove the event from the queue
-
-            controls["time_until_next"] = 0
-            if event_queue:
-                controls["time_until_next"] = event_queue[0][0] - current_time
-                
-            for event in events_to_trigger:
-                # Your logic to handle the event goes here.
-                # This could be playing a note, stopping a note, etc.
-                print(f"Triggering event at {current_time}: {event}")
-            event = pygame.event.Event(custom_event, note=events_to_trigger[0].note, velocity=events_to_trigger[0].velocity)
-            pygame.event.post(event)
-        else:
-            # Sleep for a short duration to avoid busy waiting
-            time.sleep(0.01)  # Adjust sleep time as needed for your application
-
-    # now cleanup and switch state
-    stop_playback(controls)
-
-def trigger_playback_events(event_queue, custom_event, controls):
-    start_time = time.time()  # Get the current time to use as the start time
-
-    while event_queue:
-        # Calculate elapsed time
-        current_time = time.time() - start_time
-
-        # Check if the first event in the queue is due to be triggered
-        if event_queue[0][0] <= current_time:
-            _, events_to_trigger = event_queue.pop(0)  # Remove the event from the queue
-                
-            for event in events_to_trigger:
-                # Your logic to handle the event goes here.
-                # This could be playing a note, stopping a note, etc.
-                print(f"Triggering event at {current_time}: {event}")
-            event = pygame.event.Event(custom_event, note=events_to_trigger[0].note, velocity=events_to_trigger[0].velocity)
-            pygame.event.post(event)
-        else:
-            # Sleep for a short duration to avoid busy waiting
-            time.sleep(0.01)  # Adjust sleep time as needed for your application
-
-    # now cleanup and switch state
-    stop_playback(controls)
\ No newline at end of file
+def trigger_playback_events(schedule, custom_event, controls):
+    controls["scheduler"] = NoteScheduler(schedule, custom_event, controls)
+    controls["scheduler"].run()
@@ -1,8 +1,10 @@
 import pygame
 import pygame.gfxdraw
 import math
+import numpy as np
 
 from settings import FPS
+from trajectory import BallisticPath
 
 class Ball:
     def __init__(self, x, y, radius, color, outline_color, velocity, gravity, restitution):
@@ -70,50 +72,29 @@ class Ball:
             speed * math.sin(reflection_angle_rad)  # Negate y-component to account for Pygame's coordinate system
         )
     
-    def project_bounce_path(self, platform_angle, total_time=2, time_per_step=0.1):
-        projected_path = []
-        # Starting from the ball's current position
-        sim_position = [self.x, self.y]
+    def bounce_velocity(self, platform_angle):
+        """
+        Velocity after bouncing off a platform at platform_angle (degrees, scalar or
+        array), using the velocity the ball had before it was paused.
 
-        # Initial velocity considering the bounce off the platform, using ball's prev_velocity
+        :return: Array of shape (..., 2).
+        """
         velocity_angle_rad = math.atan2(-self.prev_velocity[1], self.prev_velocity[0])
-        platform_angle_rad = math.radians(platform_angle)
-        reflection_angle_rad = 2*platform_angle_rad - velocity_angle_rad
-        
-        # Calculate the speed (magnitude of the velocity vector)
-        speed = math.sqrt(self.prev_velocity[0] ** 2 + self.prev_velocity[1] ** 2)
-        
-        # Apply restitution
-        speed *= self.restitution
+        reflection_angle_rad = 2*np.radians(platform_angle) - velocity_angle_rad
 
-        # Update the velocity based on the reflection angle
-        sim_velocity = [
-            -speed * math.cos(reflection_angle_rad), 
-            speed * math.sin(reflection_angle_rad)  # Negate y-component for Pygame's coordinate system
-        ]
-
-        steps = int((total_time * FPS) / time_per_step)
+        # Calculate the speed (magnitude of the velocity vector) and apply restitution
+        speed = math.sqrt(self.prev_velocity[0] ** 2 + self.prev_velocity[1] ** 2) * self.restitution
 
-        for _ in range(steps):
-            # Apply gravity to the y-component of the velocity
-            sim_velocity[1] -= self.gravity * time_per_step
+        # Negate y-component to account for Pygame's coordinate system
+        return np.stack([-speed * np.cos(reflection_angle_rad), speed * np.sin(reflection_angle_rad)], axis=-1)
 
-            # Simulate the ball's movement
-            sim_position[0] += sim_velocity[0] * time_per_step
-            sim_position[1] += sim_velocity[1] * time_per_step
+    def bounce_path(self, platform_angle, total_time):
+        """
+        Closed-form path the ball will follow for total_time seconds after bouncing
+        off a platform at platform_angle (scalar or array).
+        """
+        return BallisticPath.from_frame_steps((self.x, self.y), self.bounce_velocity(platform_angle), self.gravity, total_time * FPS)
 
-            # Update the projected path with the new position
-            projected_path.append(tuple(sim_position))
-     
-        # # print every parameter and every self variable used in this function
-        # print("platform_angle",platform_angle)
-        # print("total_time",total_time)
-        # print("time_per_step",time_per_step)
-        # print("self.prev_velocity",self.prev_velocity)
-        # print("self.restitution",self.restitution)
-        # print("self.gravity",self.gravity)
-        # print("self.x",self.x)
-        # print("self.y",self.y)
-        # print("self.radius",self.radius)
-
-        self.projected_path = projected_path
\ No newline at end of file
+    def project_bounce_path(self, platform_angle, total_time=2, time_per_step=0.1):
+        path = self.bounce_path(platform_angle, total_time)
+        self.projected_path = [tuple(point) for point in path.sample(time_per_step).tolist()]
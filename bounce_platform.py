@@ -1,7 +1,49 @@
 import math
+import numpy as np
 import pygame
 from settings import WHITE, RED
 
+def platform_rects(x, y, angle, offset, length, width):
+    """
+    Vectorized form of recompute_verticies: the platform rectangles for arrays of
+    anchor positions and angles, as a center plus two unit axes.
+
+    :param x: Anchor x (the ball center the platform is attached to).
+    :param y: Anchor y, in the same coordinates the result should be in.
+    :param angle: Platform angle(s) in degrees.
+    :param offset: Distance from the anchor to the platform face (the ball radius).
+    :param length: Platform length along its face.
+    :param width: Platform thickness away from the ball.
+    :return: (centers, normals, tangents) arrays of shape (..., 2); the rectangle
+             spans width/2 along the normal and length/2 along the tangent.
+    """
+    angle_rad = np.radians(angle)
+    cos, sin = np.cos(angle_rad), np.sin(angle_rad)
+    normals = np.stack(np.broadcast_arrays(cos, -sin), axis=-1)
+    tangents = np.stack(np.broadcast_arrays(-sin, -cos), axis=-1)
+    anchors = np.stack(np.broadcast_arrays(x, y), axis=-1)
+    centers = anchors + normals * (np.asarray(offset) + np.asarray(width) / 2)[..., None]
+    return centers, normals, tangents
+
+def rect_distance(points, centers, normals, tangents, length, width):
+    """
+    Distance from points to filled platform rectangles, broadcasting over leading axes.
+
+    Equivalent to the minimum edge distance used by check_collision whenever the
+    point is within ball_radius of the rectangle.
+
+    :param points: Array (..., 2) of points.
+    :param centers: Array (..., 2) of rectangle centers from platform_rects.
+    :param normals: Array (..., 2) of unit normals from platform_rects.
+    :param tangents: Array (..., 2) of unit tangents from platform_rects.
+    :return: Array of distances, 0 inside the rectangle.
+    """
+    dx = points[..., 0] - centers[..., 0]
+    dy = points[..., 1] - centers[..., 1]
+    along_normal = np.abs(dx * normals[..., 0] + dy * normals[..., 1]) - width / 2
+    along_tangent = np.abs(dx * tangents[..., 0] + dy * tangents[..., 1]) - length / 2
+    return np.hypot(np.maximum(along_normal, 0), np.maximum(along_tangent, 0))
+
 class BouncePlatform:
     def __init__(self, ball, length, width):
         self.angle = 0  # Initial angle
@@ -74,6 +116,18 @@ class BouncePlatform:
         # If the closest point is within the ball's radius, there is a collision
         return min_distance <= ball_radius
 
+    def check_sweep_collision(self, path, ball_radius):
+        """
+        Swept counterpart of check_collision: does the ball touch the platform
+        anywhere along a closed-form path?
+
+        :param path: A BallisticPath, in world coordinates.
+        :param ball_radius: The radius of the ball.
+        :return: Boolean array with one entry per path in the batch.
+        """
+        centers, normals, tangents = platform_rects(self.x, self.y, self.angle, self.ball.radius, self.length, self.width)
+        return path.hits_rects(centers, normals, tangents, self.length, self.width, ball_radius)[..., 0]
+
     def closest_point_on_line(self, start_point, end_point, point):
         """
         Calculate the closest point on a line segment to a given point.
@@ -0,0 +1,217 @@
+import abc
+import itertools
+import math
+import os
+from collections import defaultdict
+
+import numpy as np
+
+from bounce_platform import platform_rects
+
+class UniformGrid:
+    """
+    Uniform grid over world coordinates mapping cells to the ids of the items
+    whose bounding boxes touch them. Items are appended in increasing id order.
+    """
+    def __init__(self, cell_size=128):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+
+    def _cell_range(self, low, high):
+        return range(math.floor(low / self.cell_size), math.floor(high / self.cell_size) + 1)
+
+    def insert(self, item, min_x, min_y, max_x, max_y):
+        for cell_x in self._cell_range(min_x, max_x):
+            for cell_y in self._cell_range(min_y, max_y):
+                self.cells[(cell_x, cell_y)].append(item)
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """
+        Sorted array of the ids of every item whose cells overlap the box.
+        """
+        x_range = self._cell_range(min_x, max_x)
+        y_range = self._cell_range(min_y, max_y)
+
+        found = []
+        if len(x_range) * len(y_range) > len(self.cells):
+            # a huge box, cheaper to walk the occupied cells
+            for (cell_x, cell_y), items in self.cells.items():
+                if cell_x in x_range and cell_y in y_range:
+                    found.extend(items)
+        else:
+            for cell_x in x_range:
+                for cell_y in y_range:
+                    items = self.cells.get((cell_x, cell_y))
+                    if items:
+                        found.extend(items)
+        return np.unique(np.array(found, dtype=int))
+
+    def remove_tail(self, stop, min_x, min_y, max_x, max_y):
+        """
+        Drop the ids >= stop from the cells the box touches. Ids are appended in
+        increasing order, so they sit at the end of every cell.
+        """
+        for cell_x in self._cell_range(min_x, max_x):
+            for cell_y in self._cell_range(min_y, max_y):
+                items = self.cells.get((cell_x, cell_y))
+                while items and items[-1] >= stop:
+                    items.pop()
+
+    def rebuild(self, boxes):
+        """
+        Replace the contents with items 0..n-1 covering the boxes, an (n, 4)
+        array; every (item, cell) pair is worked out at once and grouped by cell.
+        """
+        self.cells.clear()
+        if len(boxes) == 0:
+            return
+        low = np.floor(boxes[:, :2] / self.cell_size).astype(int)
+        high = np.floor(boxes[:, 2:] / self.cell_size).astype(int)
+        span = high - low + 1
+        counts = span[:, 0] * span[:, 1]
+
+        items = np.repeat(np.arange(len(boxes)), counts)
+        offsets = np.arange(len(items)) - np.repeat(np.cumsum(counts) - counts, counts)
+        span_y = np.repeat(span[:, 1], counts)
+        cell_x = np.repeat(low[:, 0], counts) + offsets // span_y
+        cell_y = np.repeat(low[:, 1], counts) + offsets % span_y
+
+        order = np.lexsort((items, cell_y, cell_x))
+        items, cell_x, cell_y = items[order], cell_x[order], cell_y[order]
+        starts = np.flatnonzero(np.diff(cell_x, prepend=cell_x[0] - 1) | np.diff(cell_y, prepend=cell_y[0] - 1))
+        for start, stop, x, y in zip(starts.tolist(), np.append(starts[1:], len(items)).tolist(), cell_x[starts].tolist(), cell_y[starts].tolist()):
+            self.cells[(x, y)] = items[start:stop].tolist()
+
+    def clear(self):
+        self.cells.clear()
+
+class GridStore(abc.ABC):
+    """
+    Rows of a growable array plus a UniformGrid over each row's bounding box.
+
+    Rows are appended and dropped from the end by truncate, or from the front
+    by subclasses, which move the rest down. Every row written gets a new
+    stamp and rows keep their order, so if the row at a snapshot's last index
+    still carries the stamp it had then, the rows before it are unchanged
+    too: restoring a snapshot of an earlier state of the same store is a
+    truncate, anything else rebuilds the grid.
+
+    Subclasses define the bounding box of a row with _box, and of many rows
+    at once with _boxes.
+    """
+    _store_ids = itertools.count()
+
+    def __init__(self, columns, cell_size, capacity):
+        self.grid = UniformGrid(cell_size)
+        self.count = 0
+        self._data = np.empty((capacity, columns))
+        self._stamps = np.empty(capacity, dtype=np.int64)
+        self._next_stamp = 0
+        self._store_id = (os.getpid(), next(GridStore._store_ids))
+
+    def __len__(self):
+        return self.count
+
+    @abc.abstractmethod
+    def _box(self, row):
+        # (min_x, min_y, max_x, max_y) of a row
+        pass
+
+    @abc.abstractmethod
+    def _boxes(self, rows):
+        # _box for an (n, columns) array of rows, as an (n, 4) array
+        pass
+
+    def _append_row(self, row):
+        if self.count == len(self._data):
+            self._data = np.concatenate([self._data, np.empty_like(self._data)])
+            self._stamps = np.concatenate([self._stamps, np.empty_like(self._stamps)])
+
+        self._data[self.count] = row
+        self._stamps[self.count] = self._next_stamp
+        self._next_stamp += 1
+        self.grid.insert(self.count, *self._box(self._data[self.count]))
+        self.count += 1
+
+    def truncate(self, count):
+        """
+        Keep only the first count rows.
+        """
+        for i in range(count, self.count):
+            self.grid.remove_tail(count, *self._box(self._data[i]))
+        self.count = min(self.count, count)
+
+    def snapshot(self, with_grid=False):
+        """
+        The rows and their stamps; with_grid also copies the grid cells, which
+        makes restoring a small snapshot into a cleared store nearly free.
+        """
+        cells = None
+        if with_grid:
+            cells = {key: list(items) for key, items in self.grid.cells.items() if items}
+        return (self._store_id, self._data[:self.count].copy(), self._stamps[:self.count].copy(), cells)
+
+    def restore(self, snapshot):
+        store_id, data, stamps, cells = snapshot
+        count = len(data)
+        # the rows are unchanged since the snapshot if the last one still carries its stamp
+        if store_id == self._store_id and count <= self.count and (count == 0 or self._stamps[count - 1] == stamps[-1]):
+            self.truncate(count)
+            return
+
+        if count > len(self._data):
+            capacity = max(count, 2 * len(self._data))
+            self._data = np.empty((capacity, self._data.shape[1]))
+            self._stamps = np.empty(capacity, dtype=np.int64)
+        self._data[:count] = data
+        if store_id == self._store_id:
+            self._stamps[:count] = stamps
+        else:
+            self._stamps[:count] = np.arange(self._next_stamp, self._next_stamp + count)
+            self._next_stamp += count
+        if cells is not None:
+            self.grid.cells = defaultdict(list, {key: list(items) for key, items in cells.items()})
+        else:
+            self.grid.rebuild(self._boxes(data))
+        self.count = count
+
+    def clear(self):
+        self.grid.clear()
+        self.count = 0
+
+class PlatformIndex(GridStore):
+    """
+    Placed platforms stored as growable rectangle arrays (see platform_rects)
+    plus a UniformGrid over their bounding boxes, so collision queries only
+    touch platforms near the query region however long the song is.
+    """
+    def __init__(self, cell_size=128, capacity=64):
+        # center x/y, normal x/y, tangent x/y, length, width, then the bounds
+        super().__init__(12, cell_size, capacity)
+
+    def _box(self, row):
+        return row[8:12]
+
+    def _boxes(self, rows):
+        return rows[:, 8:12]
+
+    def add(self, platform):
+        center, normal, tangent = platform_rects(platform.x, platform.y, platform.angle, platform.ball.radius, platform.length, platform.width)
+        extent = np.abs(normal) * platform.width / 2 + np.abs(tangent) * platform.length / 2
+        self._append_row((*center, *normal, *tangent, platform.length, platform.width, *(center - extent), *(center + extent)))
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """
+        Ids of the platforms that may overlap the box.
+        """
+        return self.grid.query(min_x, min_y, max_x, max_y)
+
+    def bounds(self, ids):
+        return self._data[ids, 8:12]
+
+    def rects(self, ids):
+        """
+        (centers, normals, tangents, lengths, widths) for the given ids.
+        """
+        rects = self._data[ids]
+        return rects[..., 0:2], rects[..., 2:4], rects[..., 4:6], rects[..., 6], rects[..., 7]
@@ -12,32 +12,96 @@ from gym_state_manager import GameStateManager
 
 MIDI_NOTE_ON = pygame.USEREVENT + 1
 
+# platforms in an observation, the most recent ones
+NUM_OBSERVED_PLATFORMS = 25
+
+def make_observation_space():
+    # Observations are dictionaries with the agent's location, the locations of the
+    # last 25 platforms and the agent's velocity.
+    return spaces.Dict(
+        {
+            "agent": spaces.Box(low=np.array([0,0]), high=np.array([SCREEN_WIDTH, SCREEN_HEIGHT]), dtype=float),
+            "platforms": spaces.Box(low=np.zeros((NUM_OBSERVED_PLATFORMS, 2), dtype=float),
+                        high=np.array([[SCREEN_WIDTH, SCREEN_HEIGHT]]*NUM_OBSERVED_PLATFORMS, dtype=float)),
+            "velocity": spaces.Box(low=np.array([-50, -50]), high=np.array([50, 50]), dtype=float)
+        }
+    )
+
+class ObservationBuilder:
+    """
+    Builds observations without walking the platform list.
+
+    The positions of the most recent platforms are kept in a ring buffer that
+    only changes when a platform is added, so a build costs the same however
+    long the song is. Every build returns new arrays, which the caller owns:
+    they are a few dozen numbers, and gymnasium wrappers and replay buffers
+    may keep observations as long as they like.
+    """
+    def __init__(self, num_platforms=NUM_OBSERVED_PLATFORMS):
+        self.num_platforms = num_platforms
+        self._ring = np.zeros((num_platforms, 2), dtype=np.float32)
+        self._seen = 0
+        self._platforms = None
+
+    def build(self, state_manager):
+        platforms = state_manager.platforms
+        size = self.num_platforms
+        if platforms is not self._platforms or len(platforms) < self._seen:
+            # new episode or restored state, refill from the last platforms
+            self._platforms = platforms
+            self._seen = max(len(platforms) - size, 0)
+        while self._seen < len(platforms):
+            platform = platforms[self._seen]
+            self._ring[self._seen % size] = (platform.x, platform.y)
+            self._seen += 1
+
+        # oldest first, zero padded at the end
+        if self._seen <= size:
+            out = np.zeros((size, 2), dtype=np.float32)
+            out[:self._seen] = self._ring[:self._seen]
+        else:
+            start = self._seen % size
+            out = np.concatenate([self._ring[start:], self._ring[:start]])
+
+        ball = state_manager.ball
+        return {
+            "agent": np.array((ball.x, ball.y), dtype=np.float64),
+            "platforms": out,
+            "velocity": np.array(ball.velocity, dtype=np.float64),
+        }
+
 class BuilderEnvironment(gym.Env):
-    def __init__(self):
-        # This defines a single (x, y) coordinate space where x and y are integers within the screen dimensions
-        coordinate_space = spaces.Box(low=np.array([0, 0]), high=np.array([SCREEN_WIDTH, SCREEN_HEIGHT]), dtype=float)
-
-        # Observations are dictionaries with the agent's and the target's location.
-        # Each location is encoded as an element of {0, ..., `size`}^2, i.e. MultiDiscrete([size, size]).
-        self.observation_space = spaces.Dict(
-            {
-                "agent": spaces.Box(low=np.array([0,0]), high=np.array([SCREEN_WIDTH, SCREEN_HEIGHT]), dtype=float),
-                "platforms": spaces.Box(low=np.zeros((25, 2), dtype=float),
-                            high=np.array([[SCREEN_WIDTH, SCREEN_HEIGHT]]*25, dtype=float)),
-                "velocity": spaces.Box(low=np.array([-50, -50]), high=np.array([50, 50]), dtype=float)
-            }
-        )
+    metadata = {"render_modes": ["human", "rgb_array"], "render_fps": FPS}
+
+    def __init__(self, render_mode=None, macro_step=False, songs=None):
+        assert render_mode is None or render_mode in self.metadata["render_modes"]
+        self.render_mode = render_mode
+        self.observation_space = make_observation_space()
         # Action space is an angle in degrees
         self.action_space = spaces.Discrete(360)
 
-        self.state_manager = GameStateManager()
+        # only "human" opens a window and runs in real time, the other modes
+        # train on a simulated clock, far faster than real time, and never draw
+        # unless render() is called
+        self.state_manager = GameStateManager(headless=render_mode != "human")
+        self.observations = ObservationBuilder()
 
-    def reset(self, seed=None, options=None):
-        # select midi file
-        midi_filepath = "music/short-test.mid"
-        wav_filepath = "music/short-test.wav"
+        # macro steps make one step per note: the action places the platform
+        # and the ball is then run to the next note inside the same step
+        self.macro_step = macro_step
+
+        # a SongSampler picks a new song for every episode, otherwise the
+        # default song is played every time
+        self.songs = songs
 
-        self.state_manager.reset(rate=1)
+    def reset(self, seed=None, options=None):
+        if self.songs is not None:
+            filepath, schedule = self.songs.sample()
+            self.state_manager.reset(rate=1, filepath=filepath, schedule=schedule)
+        else:
+            self.state_manager.reset(rate=1)
+        if self.macro_step:
+            self._run_to_decision()
 
         observation = self._get_obs()
         info = self._get_info()
@@ -46,7 +110,35 @@ class BuilderEnvironment(gym.Env):
 
     def step(self, action):
         self.state_manager.step(action)
+        reward = self._reward()
+        if self.macro_step:
+            reward += self._run_to_decision()
+
+        observation = self._get_obs()
+        info = self._get_info()
 
+        return observation, reward, self.state_manager.terminated, False, info
+
+    def action_masks(self):
+        # angles allowed for the note waiting on an action, any angle otherwise
+        # since the action is ignored; read by sb3-contrib's MaskablePPO
+        if self.state_manager.awaiting_action:
+            return np.asarray(self.state_manager.action_mask, dtype=bool)
+        return np.ones(self.action_space.n, dtype=bool)
+
+    def _run_to_decision(self):
+        # frames until the next note asks for an angle or the episode ends,
+        # returning the sum of their rewards; the frame that pauses on the note
+        # is rewarded with the step that answers it
+        state_manager = self.state_manager
+        reward = 0
+        while not state_manager.terminated and not state_manager.awaiting_action:
+            state_manager.step(None)
+            if not state_manager.awaiting_action:
+                reward += self._reward()
+        return reward
+
+    def _reward(self):
         terminated = self.state_manager.terminated
         completed = self.state_manager.completed
         num_platforms = len(self.state_manager.platforms)
@@ -59,62 +151,29 @@ class BuilderEnvironment(gym.Env):
             reward *= 0.5
 
         #reward = 10 if terminated and completed else -10 if terminated else 0
-        observation = self._get_obs()
-        info = self._get_info()
+        return reward
+
+    def render(self):
+        # "human" frames are drawn by step itself
+        if self.render_mode != "rgb_array":
+            return None
 
-        return observation, reward, terminated, False, info
+        # (height, width, 3) copy of the frame, callers may keep it
+        state_manager = self.state_manager
+        return state_manager.renderer.frame(state_manager.ball, state_manager.platforms, state_manager.vertical_offset)
 
     def close(self):
         self.state_manager.close()
-        self.state_manager.midi_thread.join()
+        if self.songs is not None:
+            self.songs.close()
 
     def playback(self):
         self.state_manager.init_playback()
 
     def _get_obs(self):
-        platform_locations = []
-
-        # Collect platform locations
-        for platform in self.state_manager.platforms:
-            platform_locations.append(np.array([platform.x, platform.y], dtype=np.float32))
-        
-        # Ensure only the last 25 platform locations are kept if there are more than 25 platforms
-        if len(platform_locations) > 25:
-            platform_locations = platform_locations[-25:]
-        elif len(platform_locations) < 25:
-            # Pad with zeros if there are fewer than 25 platforms to maintain a fixed size (25, 2)
-            platform_locations.extend([np.array([0, 0], dtype=np.float32)] * (25 - len(platform_locations)))
-
-        # Convert list of platform locations to a numpy array
-        platform_locations = np.array(platform_locations, dtype=np.float32)
-
-        # Padding is no longer needed here because we have ensured the array is always (25, 2)
-        return {
-            "agent": np.array([self.state_manager.ball.x, self.state_manager.ball.y], dtype=np.float64),
-            "platforms": platform_locations,  # This is a fixed-size array of shape (25, 2)
-            "velocity": np.array([self.state_manager.ball.velocity[0], self.state_manager.ball.velocity[1]], dtype=np.float64)
-        }
-        # platform_locations = []
-
-        # for platform in self.state_manager.platforms:
-        #     platform_locations.append(np.array([platform.x, platform.y], dtype=np.float64))
-        
-        # while len(platform_locations) < len(self.state_manager.global_event_queue):
-        #     platform_locations.append(np.array([0, 0], dtype=np.float64))
-
-        # # create a platform_locations array that is properly shaped/formatted for observation space
-        # platform_locations = np.array(platform_locations, dtype=np.float64)
-        # platform_locations = np.pad(platform_locations, ((0, len(self.state_manager.global_event_queue) - len(platform_locations)), (0, 0)), mode='constant')
-
-        # return {
-        #     "agent": np.array([self.state_manager.ball.x, self.state_manager.ball.y], dtype=np.float64),
-        #     "platforms": platform_locations  # This is a list of ndarrays now
-        # }
-    
-    # filler for now, don't know what info will consist of
+        return self.observations.build(self.state_manager)
+
     def _get_info(self):
         return {
-            # "distance": np.linalg.norm(
-            #     self._agent_location - self._target_location, ord=1
-            # )
-        }
\ No newline at end of file
+            "action_mask": self.action_masks()
+        }
@@ -5,84 +5,161 @@ import threading
 import sys
 import audio
 import math
-import time
+from collections import namedtuple
 from ball import Ball
 from bounce_platform import BouncePlatform
-from settings import SCREEN_WIDTH, SCREEN_HEIGHT, BLACK, WHITE, RED, GREEN, FPS, CAMERA_CENTER, INITIAL_VELOCITY, INITIAL_X, INITIAL_Y
+from action_mask import compute_action_mask
+from broadphase import PlatformIndex
+from trail import TrailStore
+from playback import PlaybackEngine
+from renderer import Renderer
+from sim_clock import WallClock, SimulatedClock
+from settings import SCREEN_WIDTH, SCREEN_HEIGHT, WHITE, RED, GREEN, FPS, CAMERA_CENTER, INITIAL_VELOCITY, INITIAL_X, INITIAL_Y, BALL_RADIUS, GRAVITY, RESTITUTION, PLATFORM_LENGTH, PLATFORM_WIDTH
 
 MIDI_NOTE_ON = pygame.USEREVENT + 1
 
+# elapsed time is a difference of clock readings, allow for its rounding so a
+# note due on a frame is not delayed to the next one
+TIME_EPSILON = 1e-9
+
+# seconds the ball falls before the first note
+FALL_TIME = 0.5
+
+# playback draws up to this many frames a second, and the arrow keys seek
+# by PLAYBACK_SEEK seconds
+PLAYBACK_FPS = 60
+PLAYBACK_SEEK = 5
+
+# Everything GameStateManager.restore needs to bring a run back to an earlier
+# frame. Times are relative to the start of the run so a snapshot can be
+# restored on any clock, and nothing in it refers to pygame.
+SimSnapshot = namedtuple('SimSnapshot', [
+    'ball',                 # (x, y, velocity, prev_velocity, paused)
+    'platforms',            # placed BouncePlatforms, never changed once placed
+    'pending',              # (x, y) of the platform waiting for an angle, or None
+    'platform_index',       # PlatformIndex.snapshot()
+    'frame_data',           # TrailStore.snapshot()
+    'schedule',             # NoteSchedule at the run's rate, shared
+    'remaining',            # notes left in the queue
+    'elapsed',              # clock time since start_time
+    'pause_started',        # pause_start_time relative to start_time, or None
+    'playback',             # the other playback_controls values
+    'flags',                # (terminated, completed, need_action_flag, vertical_offset)
+    'action_mask',
+    'forbidden_angles',
+])
+
 class GameStateManager:
-    def __init__(self):
+    # max_frames and decimation bound the memory of the frame record, see TrailStore
+    def __init__(self, headless=False, clock=None, max_frames=None, decimation=1):
+        # headless runs on a simulated clock: no display, no drawing and no
+        # waiting, every step advances time by exactly 1/FPS
+        self.headless = headless
+        self.screen = None
+        if not headless:
+            self.open_display()
+
+        if clock is None:
+            clock = SimulatedClock() if headless else WallClock()
+        self.clock = clock
+
+        # containers reused by every reset, and the state right after the
+        # initial fall for each rate, which is the same every episode
+        self.ball = None
+        self.frame_data = TrailStore(max_frames=max_frames, decimation=decimation)
+        self.platform_index = PlatformIndex()
+        self.playback_controls = {"pause": threading.Event(), "stop": threading.Event()}
+        self._falls = {}
+        self.renderer = Renderer()
+
+    def open_display(self):
         pygame.init()
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        self.clock = pygame.time.Clock()
 
     # this state will only run once, to set up builder
-    def reset(self, rate=1, filepath='music/twinkle-twinkle-little-star.mid'):
+    # schedule, if given, is the already parsed NoteSchedule of filepath (see SongSampler)
+    def reset(self, rate=1, filepath='music/twinkle-twinkle-little-star.mid', schedule=None):
         self.rate = rate
-        self.ball = Ball(x=INITIAL_X, y=INITIAL_Y, radius=15, color=WHITE, outline_color=RED, velocity=INITIAL_VELOCITY*rate, gravity=-0.3*rate, restitution=0.8)
-
-        self.frame_data = []
-        self.fps_data = []
-
-        # fall for a bit before starting
-        self.initial_fall(length_of_time=0.5)
-        event_queue = audio.create_global_event_queue(filepath)
-        self.global_event_queue = []
-
-        for event in event_queue:
-            event = (event[0] / rate, event[1])
-            self.global_event_queue.append(event)
-
-        self.playback_controls = { 
-            "pause": threading.Event(),  
-            "stop": threading.Event(),
+        self.filepath = filepath
+        if self.ball is None:
+            self.ball = Ball(x=INITIAL_X, y=INITIAL_Y, radius=BALL_RADIUS, color=WHITE, outline_color=RED, velocity=INITIAL_VELOCITY*rate, gravity=GRAVITY*rate, restitution=RESTITUTION)
+        ball = self.ball
+        ball.x, ball.y = INITIAL_X, INITIAL_Y
+        ball.velocity = INITIAL_VELOCITY*rate
+        ball.gravity = GRAVITY*rate
+        ball.prev_velocity = (0, 0)
+        ball.paused = False
+
+        self.frame_data.clear()
+
+        # fall for a bit before starting; off screen the fall is always the
+        # same, so it is simulated once per rate and then copied in
+        fall = self._falls.get(rate)
+        if not self.headless:
+            self.initial_fall(length_of_time=FALL_TIME)
+        elif fall is None:
+            self.initial_fall(length_of_time=FALL_TIME)
+            self._falls[rate] = ((ball.x, ball.y, ball.velocity), self.frame_data.snapshot(with_grid=True), self.vertical_offset)
+        else:
+            (ball.x, ball.y, ball.velocity), trail, self.vertical_offset = fall
+            self.frame_data.restore(trail)
+
+        if schedule is None:
+            schedule = audio.create_global_event_queue(filepath)
+        # the whole song at this rate, shared and never changed; the cursor
+        # points at the next note
+        self.schedule = schedule.with_rate(rate)
+        self.cursor = self.schedule.cursor()
+
+        self.playback_controls["pause"].clear()
+        self.playback_controls["stop"].clear()
+        self.playback_controls.update({
             "total_paused_duration": 0,
             "pause_start_time": None,
-            "time_until_next": self.global_event_queue[0][0],
+            "time_until_next": self.cursor.time,
             "can_resume": True,
             "alert_color": GREEN
-        }
-        audio.init()
-        #self.midi_thread = threading.Thread(target=audio.trigger_builder_events, args=(self.global_event_queue, filepath, MIDI_NOTE_ON, self.playback_controls))
+        })
+        if not self.headless:
+            audio.init()
+        #self.midi_thread = threading.Thread(target=audio.trigger_builder_events, args=(self.schedule, filepath, MIDI_NOTE_ON, self.playback_controls))
         #self.midi_thread.start()
         self.platforms = []
+        self.platform_index.clear()
         self.terminated = False
         self.completed = False
         self.need_action_flag = False
-        self.start_time = time.time()
+        self.start_time = self.clock.time()
         # audio.play("music/twinkle-twinkle-little-star-non-16.wav")
 
     def step(self, action):
-        for event in pygame.event.get():  # This ensures that all events are processed
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                raise SystemExit  # Ensure a clean exit
+        if not self.headless:
+            for event in pygame.event.get():  # This ensures that all events are processed
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    raise SystemExit  # Ensure a clean exit
         
-        if not self.global_event_queue:
+        if self.cursor.done:
             self.completed = True
             self.terminated = True
             return
 
         if not self.playback_controls["pause"].is_set():
-            self.frame_data.append((self.ball.x, self.ball.y, time.time() - self.start_time - self.playback_controls["total_paused_duration"]  ))
-            self.fps_data.append(self.clock.get_fps())
+            self.frame_data.append((self.ball.x, self.ball.y, self.clock.time() - self.start_time - self.playback_controls["total_paused_duration"], self.clock.get_fps()))
 
-        self.screen.fill(BLACK)
         self.vertical_offset = self.ball.y - CAMERA_CENTER
 
         # Calculate elapsed time, account for pause duration
-        current_time = time.time() - self.start_time - self.playback_controls["total_paused_duration"] 
+        current_time = self.clock.time() - self.start_time - self.playback_controls["total_paused_duration"] 
 
         #print(f"Current time: {current_time}, Start time: {self.start_time}, Total paused duration: {self.playback_controls['total_paused_duration']}")
 
-        if self.global_event_queue[0][0] <= current_time or self.need_action_flag:
+        if self.cursor.time <= current_time + TIME_EPSILON or self.need_action_flag:
             if not self.playback_controls["pause"].is_set():
-                audio.pause_playback(self.playback_controls)
+                audio.pause_playback(self.playback_controls, self.clock)
                 self.ball.pause()
 
-                self.new_platform = BouncePlatform(self.ball, length=50, width=10)
+                self.new_platform = BouncePlatform(self.ball, length=PLATFORM_LENGTH, width=PLATFORM_WIDTH)
                 self.platforms.append(self.new_platform)
 
                 # Get action mask
@@ -93,6 +170,10 @@ class GameStateManager:
                     self.terminated = True
                     return
 
+                # no action yet, stop here and wait for one (macro steps)
+                if action is None:
+                    return
+
             # Use mask
             # if action is 1 - pop and execute action/add to paused duration and resume
             # else continue
@@ -102,48 +183,120 @@ class GameStateManager:
                 # path = self.action_paths[int(action)]
                 # print(path)
                 self.need_action_flag = False
-                time_of_note, events = self.global_event_queue.pop(0)
+                self.cursor.advance()
 
                 # Calculate elapsed time, account for pause duration
-                current_time = time.time() - self.start_time - self.playback_controls["total_paused_duration"]  
+                current_time = self.clock.time() - self.start_time - self.playback_controls["total_paused_duration"]  
 
                 self.playback_controls["time_until_next"] = 0
-                if self.global_event_queue:
-                    self.playback_controls["time_until_next"] = self.global_event_queue[0][0] - current_time
+                if not self.cursor.done:
+                    self.playback_controls["time_until_next"] = self.cursor.time - current_time
 
                 # pygame.gfxdraw.aacircle(self.screen, int(self.action_paths[int(action)][-1][0]), int(self.action_paths[int(action)][-1][1] - self.vertical_offset), 15, GREEN)
                 # pygame.gfxdraw.filled_circle(self.screen, int(self.action_paths[int(action)][-1][0]), int(self.action_paths[int(action)][-1][1] - self.vertical_offset), 15, GREEN)
                 # time.sleep(2)
 
-                audio.resume_playback(self.playback_controls)
+                audio.resume_playback(self.playback_controls, self.clock)
                 self.ball.resume()
 
                 self.platforms[-1].angle = action
                 self.platforms[-1].recompute_verticies(True, self.vertical_offset)
+                self.platform_index.add(self.platforms[-1])
 
                 self.ball.bounce_off_platform(self.platforms[-1])
             else:
+                # rejected angle: the ball stays paused and nothing on screen
+                # changes, so skip the update, the drawing and the tick
                 self.need_action_flag = True
+                return
 
        
         self.ball.update()
-        self.ball.draw(self.screen, y_offset=self.vertical_offset)
 
-        # if self.playback_controls["pause"].is_set():
-        #     pygame.gfxdraw.aacircle(self.screen, int(self.action_paths[int(action)][-1][0]), int(self.action_paths[int(action)][-1][1] - self.vertical_offset), 15, GREEN)
-        #     pygame.gfxdraw.filled_circle(self.screen, int(self.action_paths[int(action)][-1][0]), int(self.action_paths[int(action)][-1][1] - self.vertical_offset), 15, GREEN)
+        if not self.headless:
+            # Update the display, only where something moved
+            pygame.display.update(self.renderer.update(self.screen, self.ball, self.platforms, self.vertical_offset))
 
-        for platform in self.platforms:
-            platform.draw(self.screen, y_offset=self.vertical_offset)
+            # Calculate and display the frame rate
+            pygame.display.set_caption("FPS: {:.2f}".format(self.clock.get_fps()))
 
-        # Update the display
-        pygame.display.flip()
-        
-        # Cap the frame rate
+        # Cap the frame rate (the simulated clock just advances 1/FPS)
         self.clock.tick(FPS)
 
-        # Calculate and display the frame rate
-        pygame.display.set_caption("FPS: {:.2f}".format(self.clock.get_fps()))
+    def snapshot(self):
+        """
+        The complete simulation state as a SimSnapshot. Copying it costs the size
+        of the trail and platform arrays; placed platforms are shared.
+        """
+        ball = self.ball
+        controls = self.playback_controls
+        paused = controls["pause"].is_set()
+        pending = None
+        if paused and not self.terminated:
+            pending = (self.platforms[-1].x, self.platforms[-1].y)
+        pause_started = None
+        if controls["pause_start_time"] is not None:
+            pause_started = controls["pause_start_time"] - self.start_time
+
+        return SimSnapshot(
+            ball=(ball.x, ball.y, ball.velocity, ball.prev_velocity, ball.paused),
+            platforms=tuple(self.platforms[:-1] if pending else self.platforms),
+            pending=pending,
+            platform_index=self.platform_index.snapshot(),
+            frame_data=self.frame_data.snapshot(),
+            schedule=self.schedule,
+            remaining=self.cursor.remaining,
+            elapsed=self.clock.time() - self.start_time,
+            pause_started=pause_started,
+            playback=(paused, controls["total_paused_duration"], controls["time_until_next"]),
+            flags=(self.terminated, self.completed, self.need_action_flag, self.vertical_offset),
+            action_mask=getattr(self, 'action_mask', None),
+            forbidden_angles=getattr(self, 'forbidden_angles', None),
+        )
+
+    def restore(self, snapshot):
+        """
+        Bring the run back to the state saved in snapshot. The manager must have
+        been reset once so the ball and playback controls exist.
+        """
+        ball = self.ball
+        ball.x, ball.y, ball.velocity, ball.prev_velocity, ball.paused = snapshot.ball
+
+        self.platforms = list(snapshot.platforms)
+        if snapshot.pending is not None:
+            # the waiting platform gets its angle when placed, so start from a fresh one
+            self.new_platform = BouncePlatform(ball, length=PLATFORM_LENGTH, width=PLATFORM_WIDTH)
+            self.new_platform.x, self.new_platform.y = snapshot.pending
+            self.platforms.append(self.new_platform)
+        self.platform_index.restore(snapshot.platform_index)
+        self.frame_data.restore(snapshot.frame_data)
+
+        self.schedule = snapshot.schedule
+        self.cursor = self.schedule.cursor(len(self.schedule) - snapshot.remaining)
+
+        self.start_time = self.clock.time() - snapshot.elapsed
+        controls = self.playback_controls
+        paused, controls["total_paused_duration"], controls["time_until_next"] = snapshot.playback
+        if paused:
+            controls["pause"].set()
+        else:
+            controls["pause"].clear()
+        controls["pause_start_time"] = None
+        if snapshot.pause_started is not None:
+            controls["pause_start_time"] = self.start_time + snapshot.pause_started
+
+        self.terminated, self.completed, self.need_action_flag, self.vertical_offset = snapshot.flags
+        self.action_mask = snapshot.action_mask
+        self.forbidden_angles = snapshot.forbidden_angles
+
+    @property
+    def awaiting_action(self):
+        # paused on a note until a valid angle is chosen
+        return self.playback_controls["pause"].is_set() and not self.terminated
+
+    def draw(self, surface):
+        # the current frame: ball and platforms, camera following the ball
+        self.renderer.render(surface, self.ball, self.platforms, self.vertical_offset)
 
     def close(self):
         if self.screen is not None:
@@ -151,16 +304,12 @@ class GameStateManager:
             pygame.quit()
 
     # run once to set up playback
-    def init_playback(self):
-        # reset ball position and velocity
-        self.ball.x = INITIAL_X
-        self.ball.y = INITIAL_Y
-        self.ball.velocity = INITIAL_VELOCITY
-
-        self.playback_fps = sum(self.fps_data) / len(self.fps_data)
-
-        # replay initial fall
-        self.initial_fall(length_of_time=0.5)
+    def init_playback(self, speed=1):
+        # playback is always watched in real time, even after a headless run
+        if self.screen is None:
+            self.open_display()
+        self.headless = False
+        self.clock = WallClock()
 
         self.playback_controls = { 
             "pause": threading.Event(),  
@@ -170,117 +319,72 @@ class GameStateManager:
             "time_until_next": 0,
         }
 
-        self.start_time = time.time()
-
         audio.init()
-        audio.play("music/twinkle-twinkle-little-star-non-16.wav")
         # global_event_queue = audio.create_global_event_queue('music/twinkle-twinkle-little-star.mid')
         # self.midi_thread = threading.Thread(target=audio.trigger_playback_events, args=(global_event_queue, MIDI_NOTE_ON, self.playback_controls))
         # self.midi_thread.start()
-        self.platform_index = 0
+        self.playback_engine = PlaybackEngine(self.frame_data, audio_file="music/twinkle-twinkle-little-star-non-16.wav", speed=speed)
 
-        while time.time() - self.start_time < self.frame_data[-1][2]:
-            self.playback()
-            if self.playback_controls["stop"].is_set():
-                break
-        while self.platform_index < len(self.frame_data):
+        while not self.playback_engine.finished:
             self.playback()
             if self.playback_controls["stop"].is_set():
                 break
+        self.playback_engine.stop()
 
     def playback(self):
-        self.screen.fill(BLACK)
-        vertical_offset = self.ball.y - CAMERA_CENTER
+        engine = self.playback_engine
 
-        # Event handling
+        # Event handling: left and right seek, up and down change the speed
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                self.running = False
-            pygame.time.delay(10)  # Small delay to limit CPU usage
-        
-        if(time.time() - self.start_time > self.frame_data[self.platform_index][2]):
-            self.ball.x = self.frame_data[self.platform_index][0]
-            self.ball.y = self.frame_data[self.platform_index][1]
-            self.platform_index += 1
-        #self.ball.update()
-        self.ball.draw(self.screen, y_offset=vertical_offset)
-
-        for platform in self.platforms:
-            platform.draw(self.screen, y_offset=vertical_offset)
-        
-        # Update the display
-        pygame.display.flip()
-        
-        # Cap the frame rate
-        self.clock.tick(FPS)
+                self.playback_controls["stop"].set()
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_LEFT:
+                    engine.seek(engine.time() - PLAYBACK_SEEK)
+                elif event.key == pygame.K_RIGHT:
+                    engine.seek(engine.time() + PLAYBACK_SEEK)
+                elif event.key == pygame.K_UP:
+                    engine.set_speed(engine.speed * 2)
+                elif event.key == pygame.K_DOWN:
+                    engine.set_speed(engine.speed / 2)
+
+        # wherever the clock is now, however long the last frame took
+        self.ball.x, self.ball.y = engine.position()
+        self.vertical_offset = self.ball.y - CAMERA_CENTER
+
+        # Update the display, only where something moved
+        pygame.display.update(self.renderer.update(self.screen, self.ball, self.platforms, self.vertical_offset))
 
-        pygame.display.set_caption("FPS: {:.2f}".format(self.clock.get_fps()))
+        # Cap the frame rate, drawing faster only smooths the interpolation
+        self.clock.tick(PLAYBACK_FPS)
+
+        pygame.display.set_caption("FPS: {:.2f}  x{:g}".format(self.clock.get_fps(), engine.speed))
 
     def initial_fall(self, length_of_time):
         # fall for a bit before starting
-        start_time = time.time()
-        current_time = time.time()
+        start_time = self.clock.time()
+        current_time = self.clock.time()
         self.vertical_offset = self.ball.y - CAMERA_CENTER
-        while(current_time - start_time < length_of_time):
-            self.frame_data.append((self.ball.x, self.ball.y, current_time - start_time))
-            self.fps_data.append(self.clock.get_fps())
+        while(current_time - start_time < length_of_time - TIME_EPSILON):
+            self.frame_data.append((self.ball.x, self.ball.y, current_time - start_time, self.clock.get_fps()))
 
-            self.screen.fill(BLACK)
             self.ball.update()
-            self.ball.draw(self.screen, y_offset=self.vertical_offset)
 
-            self.vertical_offset = self.ball.y - CAMERA_CENTER
-            current_time = time.time()
+            if not self.headless:
+                # Update the display, no platforms yet
+                pygame.display.update(self.renderer.update(self.screen, self.ball, [], self.vertical_offset))
 
-            # Update the display
-            pygame.display.flip()
+            self.vertical_offset = self.ball.y - CAMERA_CENTER
 
             # Cap the frame rate
             self.clock.tick(FPS)
+            current_time = self.clock.time()
 
     def get_action_mask(self):
-        action_mask = []
-        self.action_paths = []
-
-        for i in range(0, 360):
-            can_take_action = True
-
-            # Convert the angle to degrees and update the platform's angle
-            self.platforms[-1].angle = i
-            self.platforms[-1].recompute_verticies(True, self.vertical_offset)
-
-            # If there will still be another platform after this one, 
-            # project the bounce path and check for collisions
-            if len(self.global_event_queue) > 1:
-                time_to_project = self.global_event_queue[1][0] - self.global_event_queue[0][0]
-                
-                # Now, project the bounce path based on the new angle
-                self.ball.project_bounce_path(self.platforms[-1].angle, total_time=time_to_project)#total_time=self.playback_controls["time_until_next"])
-                self.action_paths.append(self.ball.projected_path)
-
-                # Check for collisions with the projected path
-                for point in self.ball.projected_path:
-                    x, y = int(point[0]), int(point[1] - self.vertical_offset)
-                    for i, platform in enumerate(self.platforms[:-1]):
-                        if platform.check_collision((x,y), self.ball.radius):
-                            can_take_action = False
-                            break
-                    if x < 25 or x > SCREEN_WIDTH - 25:
-                        can_take_action = False
-                        break
-
-            # Check all frames of ball position for collision with new platform's placement
-            # recent_frames = self.frame_data[:-1]
-
-            for frame in self.frame_data[:-1]:
-                ball_x, ball_y, _ = frame
-                if self.platforms[-1].check_collision((ball_x, ball_y - self.vertical_offset), self.ball.radius):
-                    can_take_action = False
-                    break
-
-            if can_take_action:
-                action_mask.append(1)
-            else:
-                action_mask.append(0)
+        # If there will still be another platform after this one,
+        # project the bounce path and check it for collisions
+        time_to_project = self.cursor.interval()
 
-        return action_mask
\ No newline at end of file
+        action_mask, self.forbidden_angles = compute_action_mask(self.ball, self.platforms[-1], self.platform_index, self.frame_data,
+                                                                 time_to_project=time_to_project)
+        return action_mask
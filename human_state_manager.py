@@ -8,6 +8,7 @@ import math
 import time
 from ball import Ball
 from bounce_platform import BouncePlatform
+from renderer import Renderer
 from settings import SCREEN_WIDTH, SCREEN_HEIGHT, BLACK, WHITE, RED, GREEN, FPS, CAMERA_CENTER, INITIAL_VELOCITY, INITIAL_X, INITIAL_Y
 
 MIDI_NOTE_ON = pygame.USEREVENT + 1
@@ -21,6 +22,7 @@ class GameStateManager:
         self.state = "MAIN_MENU"
 
         self.ball = Ball(x=INITIAL_X, y=INITIAL_Y, radius=15, color=WHITE, outline_color=RED, velocity=INITIAL_VELOCITY, gravity=-0.3, restitution=0.8)
+        self.renderer = Renderer()
 
     def main_menu(self):
         for event in pygame.event.get():
@@ -32,6 +34,7 @@ class GameStateManager:
         self.screen.fill((0, 100, 200))
         # Render main menu...
         pygame.display.flip()
+        self.renderer.invalidate()
 
     # this state will only run once, to set up builder
     def init_builder(self, filepath='music/twinkle-twinkle-little-star.mid'):
@@ -48,8 +51,8 @@ class GameStateManager:
             "alert_color": GREEN
         }
         audio.init()
-        self.global_event_queue = audio.create_global_event_queue(filepath)
-        self.midi_thread = threading.Thread(target=audio.trigger_builder_events, args=(self.global_event_queue, "music/twinkle-twinkle-little-star-non-16.wav", MIDI_NOTE_ON, self.playback_controls))
+        self.schedule = audio.create_global_event_queue(filepath)
+        self.midi_thread = threading.Thread(target=audio.trigger_builder_events, args=(self.schedule, "music/twinkle-twinkle-little-star-non-16.wav", MIDI_NOTE_ON, self.playback_controls))
         self.midi_thread.start()
         self.platforms = []
         self.frame_data = []
@@ -61,7 +64,6 @@ class GameStateManager:
            self.frame_data.append((self.ball.x, self.ball.y))
            self.fps_data.append(self.clock.get_fps())
 
-        self.screen.fill(BLACK)
         self.vertical_offset = self.ball.y - CAMERA_CENTER
 
         # Event handling
@@ -126,21 +128,20 @@ class GameStateManager:
             pygame.time.delay(10)  # Small delay to limit CPU usage
         
         self.ball.update()
-        self.ball.draw(self.screen, y_offset=self.vertical_offset)
-
-        for platform in self.platforms:
-            platform.draw(self.screen, y_offset=self.vertical_offset)
+        dirty = self.renderer.update(self.screen, self.ball, self.platforms, self.vertical_offset)
         
         if self.playback_controls["pause"].is_set():
             # Draw the projected path
+            radius = self.ball.radius
             for point in self.ball.projected_path:
                 x, y = int(point[0]), int(point[1] - self.vertical_offset)
                 # Draw the outline
-                pygame.gfxdraw.aacircle(self.screen, x, y, self.ball.radius, self.playback_controls["alert_color"])
-                pygame.gfxdraw.filled_circle(self.screen, x, y, self.ball.radius, self.playback_controls["alert_color"])
+                pygame.gfxdraw.aacircle(self.screen, x, y, radius, self.playback_controls["alert_color"])
+                pygame.gfxdraw.filled_circle(self.screen, x, y, radius, self.playback_controls["alert_color"])
+                dirty.append(self.renderer.track(pygame.Rect(x - radius, y - radius, 2 * radius + 1, 2 * radius + 1)))
         
-        # Update the display
-        pygame.display.flip()
+        # Update the display, only where something changed
+        pygame.display.update(dirty)
         
         # Cap the frame rate
         self.clock.tick(FPS)
@@ -154,7 +155,6 @@ class GameStateManager:
            self.frame_data.append((self.ball.x, self.ball.y))
            self.fps_data.append(self.clock.get_fps())
 
-        self.screen.fill(BLACK)
         self.vertical_offset = self.ball.y - CAMERA_CENTER
 
         # Event handling
@@ -219,21 +219,20 @@ class GameStateManager:
             pygame.time.delay(10)  # Small delay to limit CPU usage
         
         self.ball.update()
-        self.ball.draw(self.screen, y_offset=self.vertical_offset)
-
-        for platform in self.platforms:
-            platform.draw(self.screen, y_offset=self.vertical_offset)
+        dirty = self.renderer.update(self.screen, self.ball, self.platforms, self.vertical_offset)
         
         if self.playback_controls["pause"].is_set():
             # Draw the projected path
+            radius = self.ball.radius
             for point in self.ball.projected_path:
                 x, y = int(point[0]), int(point[1] - self.vertical_offset)
                 # Draw the outline
-                pygame.gfxdraw.aacircle(self.screen, x, y, self.ball.radius, self.playback_controls["alert_color"])
-                pygame.gfxdraw.filled_circle(self.screen, x, y, self.ball.radius, self.playback_controls["alert_color"])
+                pygame.gfxdraw.aacircle(self.screen, x, y, radius, self.playback_controls["alert_color"])
+                pygame.gfxdraw.filled_circle(self.screen, x, y, radius, self.playback_controls["alert_color"])
+                dirty.append(self.renderer.track(pygame.Rect(x - radius, y - radius, 2 * radius + 1, 2 * radius + 1)))
         
-        # Update the display
-        pygame.display.flip()
+        # Update the display, only where something changed
+        pygame.display.update(dirty)
         
         # Cap the frame rate
         self.clock.tick(FPS)
@@ -272,7 +271,6 @@ class GameStateManager:
         self.state = "PLAYBACK"
 
     def playback(self):
-        self.screen.fill(BLACK)
         vertical_offset = self.ball.y - CAMERA_CENTER
 
         # Event handling
@@ -295,13 +293,9 @@ class GameStateManager:
             self.ball.y = self.frame_data[self.platform_index][1]
         self.platform_index += 1
         #self.ball.update()
-        self.ball.draw(self.screen, y_offset=vertical_offset)
 
-        for platform in self.platforms:
-            platform.draw(self.screen, y_offset=vertical_offset)
-        
-        # Update the display
-        pygame.display.flip()
+        # Update the display, only where something moved
+        pygame.display.update(self.renderer.update(self.screen, self.ball, self.platforms, vertical_offset))
         
         # Cap the frame rate
         self.clock.tick(FPS)
@@ -315,15 +309,14 @@ class GameStateManager:
         current_time = time.time()
         self.vertical_offset = self.ball.y - CAMERA_CENTER
         while(current_time - start_time < length_of_time):
-            self.screen.fill(BLACK)
             self.ball.update()
-            self.ball.draw(self.screen, y_offset=self.vertical_offset)
+            dirty = self.renderer.update(self.screen, self.ball, [], self.vertical_offset)
 
             self.vertical_offset = self.ball.y - CAMERA_CENTER
             current_time = time.time()
 
             # Update the display
-            pygame.display.flip()
+            pygame.display.update(dirty)
 
             # Cap the frame rate
             self.clock.tick(FPS)
@@ -0,0 +1,149 @@
+import argparse
+import multiprocessing as mp
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from gym_state_manager import GameStateManager
+
+# result of a search: the angle chosen for every placed note and the
+# platforms they make, (x, y, angle) each
+Layout = namedtuple('Layout', ['angles', 'platforms', 'completed', 'notes', 'seconds'])
+
+# a state on the search frontier, paused on a note with its snapshot
+Candidate = namedtuple('Candidate', ['score', 'angles', 'snapshot'])
+
+# the state manager of this process; pool workers build theirs once
+_state_manager = None
+
+def _start(filepath, rate):
+    global _state_manager
+    _state_manager = GameStateManager(headless=True)
+    _state_manager.reset(rate=rate, filepath=filepath)
+    return _state_manager
+
+def _run_to_decision(state_manager):
+    # frames until the next note waits for an angle or the run ends
+    while not state_manager.terminated and not state_manager.awaiting_action:
+        state_manager.step(None)
+
+def _expand(job):
+    """
+    Place every angle in job from the parent snapshot and run on to the next
+    note. Dead ends, where the next note has no allowed angle, are dropped.
+
+    :return: List of (angle, completed, freedom, snapshot), freedom being the
+             number of angles allowed for the next note.
+    """
+    snapshot, angles = job
+    state_manager = _state_manager
+    children = []
+    for angle in angles:
+        state_manager.restore(snapshot)
+        state_manager.step(int(angle))
+        _run_to_decision(state_manager)
+        if state_manager.completed:
+            children.append((int(angle), True, 0, state_manager.snapshot()))
+        elif not state_manager.terminated:
+            freedom = int(np.sum(state_manager.action_mask))
+            children.append((int(angle), False, freedom, state_manager.snapshot()))
+    return children
+
+def _branch_angles(mask, branching):
+    # up to branching allowed angles spread evenly over the allowed ones
+    allowed = np.nonzero(mask)[0]
+    if len(allowed) <= branching:
+        return allowed
+    return allowed[np.linspace(0, len(allowed) - 1, branching).round().astype(int)]
+
+def solve(filepath, rate=1, beam_width=8, branching=6, time_budget=30, workers=None):
+    """
+    Beam search over the platform angle of every note, with backtracking: a
+    layer with no surviving state falls back on the best unexpanded states of
+    the layers above it.
+
+    States are ranked by how many angles the next note allows, so the beam
+    keeps the layouts with the most room left. Expansions run on a process
+    pool, each worker stepping its own headless GameStateManager.
+
+    :param filepath: MIDI file to lay out.
+    :param rate: Playback rate, as in GameStateManager.reset.
+    :param beam_width: States kept per note.
+    :param branching: Allowed angles tried from each state.
+    :param time_budget: Seconds before the search gives up and returns the deepest layout found.
+    :param workers: Pool size, the number of cores by default; 1 searches in this process.
+    :return: A Layout, completed only if every note got a platform.
+    """
+    start = time.time()
+    state_manager = _start(filepath, rate)
+    _run_to_decision(state_manager)
+
+    pool = None
+    if workers is None:
+        workers = mp.cpu_count()
+    if workers > 1:
+        pool = mp.get_context("spawn").Pool(workers, initializer=_start, initargs=(filepath, rate))
+
+    root = state_manager.snapshot()
+    frontier = [[]]
+    beam = [Candidate(0, (), root)]
+    best = beam[0]
+    solution = None
+    try:
+        while beam and time.time() - start < time_budget:
+            jobs = [(candidate.snapshot, _branch_angles(candidate.snapshot.action_mask, branching)) for candidate in beam]
+            if pool is not None:
+                results = pool.map(_expand, jobs)
+            else:
+                results = [_expand(job) for job in jobs]
+
+            children = []
+            for candidate, expanded in zip(beam, results):
+                for angle, completed, freedom, snapshot in expanded:
+                    child = Candidate(freedom, candidate.angles + (angle,), snapshot)
+                    if completed:
+                        solution = child
+                        break
+                    children.append(child)
+                if solution is not None:
+                    break
+            if solution is not None:
+                break
+
+            children.sort(key=lambda child: child.score, reverse=True)
+            frontier.append(children[beam_width:])
+            beam = children[:beam_width]
+            if beam and len(beam[0].angles) > len(best.angles):
+                best = beam[0]
+
+            # dead end: back up to the deepest layer with states left
+            while not beam and frontier:
+                layer = frontier[-1]
+                if layer:
+                    beam, frontier[-1] = layer[:beam_width], layer[beam_width:]
+                else:
+                    frontier.pop()
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    result = solution if solution is not None else best
+    state_manager.restore(result.snapshot)
+    platforms = [(platform.x, platform.y, platform.angle) for platform in state_manager.platforms[:len(result.angles)]]
+    return Layout(list(result.angles), platforms, solution is not None, len(result.angles), time.time() - start)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Search for a platform layout that completes a song.")
+    parser.add_argument('filepath')
+    parser.add_argument('--rate', type=float, default=1)
+    parser.add_argument('--beam', type=int, default=8)
+    parser.add_argument('--branching', type=int, default=6)
+    parser.add_argument('--budget', type=float, default=30, help="seconds")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    layout = solve(args.filepath, rate=args.rate, beam_width=args.beam, branching=args.branching,
+                   time_budget=args.budget, workers=args.workers)
+    print("{} after {:.1f}s, {} notes placed".format("Completed" if layout.completed else "Gave up", layout.seconds, layout.notes))
+    print(layout.angles)
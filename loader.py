@@ -1,22 +1,27 @@
 import gymnasium
 from game_env import BuilderEnvironment
+from replay import Replay
 from gymnasium.envs.registration import register
-from stable_baselines3 import PPO
+from sb3_contrib import MaskablePPO
 
 import os
 
 models_dir = 'models/PPO'
 model_path = f"{models_dir}/model_4.zip"
+replays_dir = 'replays'
+
+if not os.path.exists(replays_dir):
+    os.makedirs(replays_dir)
 
 register(
     id='BuilderEnv',
-    entry_point=lambda: BuilderEnvironment(),
+    entry_point=lambda: BuilderEnvironment(macro_step=True),
 )
 
 env = gymnasium.make('BuilderEnv')
 env.reset()
 
-model = PPO.load(model_path, env=env, verbose=1)
+model = MaskablePPO.load(model_path, env=env, verbose=1)
 
 episodes = 10
 
@@ -24,6 +29,8 @@ for episode in range(episodes):
     obs, _ = env.reset()
     done = False
     while not done:
-        action, _ = model.predict(obs)
+        action, _ = model.predict(obs, action_masks=env.unwrapped.action_masks())
         obs, reward, done, _, info = env.step(action)
-    env.playback()
+    # watch it again later with: python replay.py replays/episode_N.gmr
+    Replay.from_state_manager(env.unwrapped.state_manager).save(f"{replays_dir}/episode_{episode}.gmr")
+    env.unwrapped.playback()
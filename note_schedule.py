@@ -0,0 +1,123 @@
+import copy
+
+import numpy as np
+
+def _frozen(values, dtype):
+    array = np.ascontiguousarray(values, dtype=dtype)
+    array.flags.writeable = False
+    return array
+
+class NoteSchedule:
+    """
+    The notes of a song grouped into chords that sound together, in flat
+    arrays: one onset per group, and the pitch, velocity and channel of every
+    note, group i owning notes offsets[i]:offsets[i + 1].
+
+    The arrays are read-only, so one schedule is shared by every episode and
+    every manager playing the song, and pickles to a few bytes per note when
+    sent to another process. Onsets are stored at rate 1; with_rate() returns
+    a view at another playback rate without touching them.
+
+    Consumers walk it with a ScheduleCursor instead of popping from it.
+
+    :param onsets: Seconds from the start of the song to each group, ascending.
+    :param offsets: Index of each group's first note, plus the total number of notes.
+    :param pitches: MIDI note number of every note.
+    :param velocities: Velocity of every note.
+    :param channels: MIDI channel of every note.
+    :param rate: Playback rate; onsets are divided by it.
+    """
+    def __init__(self, onsets, offsets, pitches, velocities, channels, rate=1):
+        self.onsets = _frozen(onsets, np.float64)
+        self.offsets = _frozen(offsets, np.int64)
+        self.pitches = _frozen(pitches, np.uint8)
+        self.velocities = _frozen(velocities, np.uint8)
+        self.channels = _frozen(channels, np.uint8)
+        # gaps between consecutive groups, at rate 1
+        self.iois = _frozen(np.diff(self.onsets), np.float64)
+        self.rate = rate
+        self._times = None
+
+    def with_rate(self, rate):
+        # shares every array with self
+        scaled = copy.copy(self)
+        scaled.rate = rate
+        scaled._times = None
+        return scaled
+
+    def __len__(self):
+        return len(self.onsets)
+
+    @property
+    def num_notes(self):
+        return len(self.pitches)
+
+    @property
+    def times(self):
+        """
+        Onsets at this schedule's rate, as an array.
+        """
+        if self._times is None:
+            self._times = self.onsets if self.rate == 1 else _frozen(self.onsets / self.rate, np.float64)
+        return self._times
+
+    @property
+    def duration(self):
+        # onset of the last group
+        return self.onset(len(self) - 1) if len(self) else 0.0
+
+    def onset(self, i):
+        return float(self.onsets[i] / self.rate)
+
+    def interval(self, i):
+        # seconds from group i to group i + 1
+        return float(self.iois[i] / self.rate)
+
+    def group(self, i):
+        """
+        Slice of the note arrays holding group i.
+        """
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def first_note(self, i):
+        """
+        (pitch, velocity) of the first note of group i.
+        """
+        first = self.offsets[i]
+        return int(self.pitches[first]), int(self.velocities[first])
+
+    def cursor(self, position=0):
+        return ScheduleCursor(self, position)
+
+class ScheduleCursor:
+    """
+    Position in a NoteSchedule: the next group to play. Advancing it leaves the
+    schedule untouched, so any number of cursors can walk the same one.
+    """
+    def __init__(self, schedule, position=0):
+        self.schedule = schedule
+        self.position = position
+
+    @property
+    def remaining(self):
+        return len(self.schedule) - self.position
+
+    @property
+    def done(self):
+        return self.position >= len(self.schedule)
+
+    @property
+    def time(self):
+        # onset of the next group
+        return self.schedule.onset(self.position)
+
+    def interval(self):
+        """
+        Seconds from the next group to the one after it, or None if it is the last.
+        """
+        if self.position + 1 >= len(self.schedule):
+            return None
+        return self.schedule.interval(self.position)
+
+    def advance(self):
+        self.position += 1
@@ -0,0 +1,128 @@
+import os
+import time
+
+import numpy as np
+import pygame
+
+from settings import FPS
+
+class PlaybackEngine:
+    """
+    Where the ball is at any moment of a recorded run, and which moment is
+    being shown.
+
+    Positions are looked up by binary search on the recorded timestamps and
+    interpolated between the two samples around the time, so playback shows
+    the right place at whatever rate frames are drawn: a slow frame skips
+    ahead instead of falling behind. Time 0 is the end of the initial fall,
+    when the song starts; the fall itself is at negative times.
+
+    The clock is the music while it plays at normal speed, and the wall clock
+    otherwise (other speeds, before the song starts, no audio file).
+
+    :param frame_data: TrailStore of the run.
+    :param audio_file: Recording of the song to play along, or None.
+    :param speed: Playback speed multiplier.
+    """
+    def __init__(self, frame_data, audio_file=None, speed=1):
+        times = np.array(frame_data.times(), dtype=np.float64)
+        self.positions = np.array(frame_data.positions(), dtype=np.float64)
+
+        # the record starts over at 0 when the fall ends, move the fall
+        # before 0 so the timestamps increase throughout
+        restarts = np.nonzero(np.diff(times) < 0)[0]
+        if len(restarts):
+            fall_end = restarts[0] + 1
+            fps = frame_data.fps()[:fall_end].mean() or FPS
+            times[:fall_end] -= times[fall_end - 1] + 1 / fps
+        self.times = times
+
+        self.audio_file = audio_file if audio_file is not None and os.path.exists(audio_file) else None
+        self.speed = speed
+        self._audio_start = None
+        self._audio_pending = False
+        self._set_clock(self.start_time, speed)
+
+    @property
+    def start_time(self):
+        return float(self.times[0]) if len(self.times) else 0.0
+
+    @property
+    def end_time(self):
+        return float(self.times[-1]) if len(self.times) else 0.0
+
+    @property
+    def finished(self):
+        return self.time() >= self.end_time
+
+    def time(self):
+        """
+        The moment of the run being shown, in seconds.
+        """
+        if self._audio_start is not None:
+            position = pygame.mixer.music.get_pos()
+            if position >= 0:
+                return self._audio_start + position / 1000
+        anchor_time, anchor_wall = self._anchor
+        now = anchor_time + (time.time() - anchor_wall) * self.speed
+        if self._audio_pending and now >= 0:
+            self._start_audio(now)
+        return now
+
+    def position(self, at=None):
+        """
+        Ball position at time at (now by default), interpolated between the
+        recorded samples and clamped to the run.
+
+        :return: (x, y)
+        """
+        if at is None:
+            at = self.time()
+        times = self.times
+        index = int(np.searchsorted(times, at, side='right'))
+        if index <= 0:
+            return tuple(self.positions[0])
+        if index >= len(times):
+            return tuple(self.positions[-1])
+        t0, t1 = times[index - 1], times[index]
+        fraction = (at - t0) / (t1 - t0) if t1 > t0 else 0.0
+        x, y = self.positions[index - 1] + (self.positions[index] - self.positions[index - 1]) * fraction
+        return float(x), float(y)
+
+    def seek(self, at):
+        self._set_clock(min(max(at, self.start_time), self.end_time), self.speed)
+
+    def set_speed(self, speed):
+        self._set_clock(self.time(), speed)
+
+    def stop(self):
+        self._stop_audio()
+
+    def _set_clock(self, at, speed):
+        self._stop_audio()
+        self.speed = speed
+        self._anchor = (at, time.time())
+        # the song only plays along at normal speed, from time 0 on
+        self._audio_pending = speed == 1
+        if at >= 0:
+            self._start_audio(at)
+
+    def _start_audio(self, at):
+        if not self._audio_pending:
+            return
+        self._audio_pending = False
+        if self.audio_file is None or not pygame.mixer.get_init():
+            return
+        pygame.mixer.music.load(self.audio_file)
+        try:
+            pygame.mixer.music.play(start=at)
+        except pygame.error:
+            # the format can't seek, stay on the wall clock
+            return
+        self._audio_start = at
+        self._anchor = (at, time.time())
+
+    def _stop_audio(self):
+        if self._audio_start is not None:
+            pygame.mixer.music.stop()
+            self._audio_start = None
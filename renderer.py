@@ -0,0 +1,158 @@
+import numpy as np
+import pygame
+
+from bounce_platform import BouncePlatform
+from settings import SCREEN_WIDTH, SCREEN_HEIGHT, BLACK, WHITE, BALL_RADIUS, PLATFORM_LENGTH, PLATFORM_WIDTH
+
+# farthest a platform's pixels reach from its anchor, platforms anchored
+# further than this outside the screen are not drawn
+CULL_MARGIN = BALL_RADIUS + PLATFORM_WIDTH + PLATFORM_LENGTH
+
+class Renderer:
+    """
+    Draws the ball and platforms for a camera at vertical_offset.
+
+    Every platform is a sprite rasterized once per integer angle and blitted,
+    instead of a polygon recomputed each frame, and only the platforms
+    anchored near the screen are drawn. Placed platforms never change, so
+    their anchors are kept in arrays and the visible ones are found with one
+    vectorized test; the last platform is read every frame since its angle can
+    still change.
+
+    render() draws a whole frame. update() draws onto a surface that keeps its
+    pixels between frames, the display: it clears what the last frame drew
+    instead of the whole surface, and returns the rectangles to pass to
+    pygame.display.update. frame() draws a whole frame and returns its pixels.
+    """
+    def __init__(self, size=(SCREEN_WIDTH, SCREEN_HEIGHT), background=BLACK):
+        self.size = size
+        self.background = background
+        self._sprites = {}
+        self._platforms = None
+        self._seen = 0
+        self._anchors = np.zeros((64, 2), dtype=np.float64)
+        # what update() drew last, cleared by the next one; None redraws all
+        self._dirty = None
+        # frame() draws here, a surface nobody else can lock
+        self._back = None
+
+    def render(self, surface, ball, platforms, vertical_offset):
+        surface.fill(self.background)
+        self._draw(surface, ball, platforms, vertical_offset)
+
+    def frame(self, ball, platforms, vertical_offset):
+        """
+        Draw a whole frame onto the renderer's own surface and copy its pixels
+        out. Views from surfarray.pixels3d lock their surface for as long as
+        they live, and a locked surface can't be blitted to, so the pixels are
+        copied rather than viewed.
+
+        :return: New (height, width, 3) uint8 array.
+        """
+        if self._back is None:
+            self._back = pygame.Surface(self.size)
+        self.render(self._back, ball, platforms, vertical_offset)
+        width, height = self.size
+        pixels = np.empty((width, height, 3), dtype=np.uint8)
+        pygame.pixelcopy.surface_to_array(pixels, self._back)
+        return pixels.transpose(1, 0, 2)
+
+    def update(self, surface, ball, platforms, vertical_offset):
+        """
+        Draw the frame onto surface, clearing only the previous frame's areas.
+
+        :return: List of rectangles that changed.
+        """
+        if self._dirty is None:
+            surface.fill(self.background)
+            previous = [surface.get_rect()]
+        else:
+            previous = self._dirty
+            for rect in previous:
+                surface.fill(self.background, rect)
+        self._dirty = self._draw(surface, ball, platforms, vertical_offset)
+        return previous + self._dirty
+
+    def track(self, rect):
+        """
+        Add rect, drawn by the caller on top of the last update(), to the areas
+        cleared by the next one.
+
+        :return: rect
+        """
+        if self._dirty is not None:
+            self._dirty.append(rect)
+        return rect
+
+    def invalidate(self):
+        # something else drew on the surface, repaint all of it next update()
+        self._dirty = None
+
+    def sprite(self, platform):
+        """
+        (surface, offset) of platform's sprite, offset being where its top left
+        corner is relative to the anchor.
+        """
+        angle = int(round(platform.angle)) % 360
+        sprite = self._sprites.get(angle)
+        if sprite is None:
+            # the same vertices BouncePlatform.draw computes, around (0, 0)
+            shape = BouncePlatform(platform.ball, length=platform.length, width=platform.width)
+            shape.x, shape.y, shape.angle = 0, 0, angle
+            shape.recompute_verticies(False, 0)
+            vertices = np.array(shape.vertices)
+            corner = np.floor(vertices.min(axis=0))
+            width, height = (np.ceil(vertices.max(axis=0)) - corner).astype(int) + 1
+
+            surface = pygame.Surface((width, height))
+            surface.fill(self.background)
+            pygame.draw.polygon(surface, WHITE, (vertices - corner).tolist())
+            surface.set_colorkey(self.background, pygame.RLEACCEL)
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert()
+            sprite = self._sprites[angle] = (surface, (int(corner[0]), int(corner[1])))
+        return sprite
+
+    def _draw(self, surface, ball, platforms, vertical_offset):
+        # ball first, platforms over it, as BouncePlatform.draw used to
+        ball.draw(surface, y_offset=vertical_offset)
+        radius = ball.radius
+        drawn = [pygame.Rect(int(ball.x) - radius, int(ball.y - vertical_offset) - radius, 2 * radius + 1, 2 * radius + 1)]
+        if not platforms:
+            return drawn
+
+        self._sync(platforms)
+        width, height = self.size
+        anchors = self._anchors[:self._seen]
+        xs = anchors[:, 0]
+        ys = anchors[:, 1] - vertical_offset
+        visible = np.nonzero((ys > -CULL_MARGIN) & (ys < height + CULL_MARGIN)
+                             & (xs > -CULL_MARGIN) & (xs < width + CULL_MARGIN))[0]
+
+        blits = []
+        for i in visible.tolist():
+            blits.append(self._blit(platforms[i], xs[i], ys[i]))
+        last = platforms[-1]
+        blits.append(self._blit(last, last.x, last.y - vertical_offset))
+        drawn += surface.blits(blits)
+        return drawn
+
+    def _blit(self, platform, x, y):
+        sprite, (dx, dy) = self.sprite(platform)
+        return sprite, (int(round(x)) + dx, int(round(y)) + dy)
+
+    def _sync(self, platforms):
+        # anchors of every platform but the last, which may still turn
+        if platforms is not self._platforms or len(platforms) - 1 < self._seen:
+            self._platforms = platforms
+            self._seen = 0
+        placed = len(platforms) - 1
+        if placed > len(self._anchors):
+            capacity = max(placed, 2 * len(self._anchors))
+            anchors = np.zeros((capacity, 2), dtype=np.float64)
+            anchors[:self._seen] = self._anchors[:self._seen]
+            self._anchors = anchors
+        for i in range(self._seen, placed):
+            platform = platforms[i]
+            self._anchors[i] = (platform.x, platform.y)
+        self._seen = placed
@@ -0,0 +1,206 @@
+import argparse
+import os
+import struct
+
+import numpy as np
+
+import audio
+from gym_state_manager import GameStateManager
+from settings import FPS, GRAVITY
+
+# file header: magic, format version, flags, rate, end frame, number of
+# angles, number of keyframes, sha1 of the song file, length of its path
+HEADER = struct.Struct('<4sHBdIII20sH')
+MAGIC = b'GMRP'
+VERSION = 1
+
+COMPLETED = 1
+
+class Replay:
+    """
+    A run reduced to what it takes to play it again: the song, the rate and
+    the angle chosen for every placed note. The headless simulation is
+    deterministic, so simulate() rebuilds the whole run from these alone.
+
+    Keyframes are the ball's (x, y, vx, vy) at the start of the run and right
+    after every bounce, with the frame they were taken on. Between two bounces
+    the ball only falls, so seek() finds the keyframe before a time by binary
+    search and steps the ball from there, never more than one note's worth of
+    frames. They are optional in the file and rebuilt by one simulation when
+    missing.
+
+    :param filepath: MIDI file of the song.
+    :param rate: Playback rate, as in GameStateManager.reset.
+    :param angles: Angle of every placed platform, in order.
+    :param completed: Whether the run placed every note.
+    :param end_frame: Frames from the end of the fall to the end of the run.
+    :param digest: sha1 of the song file the run was recorded on.
+    """
+    def __init__(self, filepath, rate, angles, completed=False, end_frame=0, digest=None, keyframes=None):
+        self.filepath = filepath
+        self.rate = rate
+        self.angles = np.asarray(angles, dtype=np.uint16)
+        self.completed = completed
+        self.end_frame = end_frame
+        self.digest = digest if digest is not None else audio.schedule_cache.file_digest(filepath)
+        # (frames, states) or None until simulated
+        self._keyframes = keyframes
+
+    @classmethod
+    def from_state_manager(cls, state_manager):
+        """
+        The replay of the run state_manager has played, or is playing. The run
+        is simulated again to collect the keyframes.
+        """
+        placed = len(state_manager.platforms)
+        if state_manager.playback_controls["pause"].is_set():
+            # the last platform is still waiting for an angle, or never got one
+            placed -= 1
+        angles = [int(platform.angle) for platform in state_manager.platforms[:placed]]
+        replay = cls(state_manager.filepath, state_manager.rate, angles)
+        replay.simulate()
+        return replay
+
+    @property
+    def duration(self):
+        return self.end_frame / FPS
+
+    def simulate(self):
+        """
+        Play the run again on a headless GameStateManager, placing the recorded
+        angles note by note, and keep the keyframes it passes through.
+
+        :return: The state manager at the end of the run, with its platforms and
+                 frame record, ready for init_playback.
+        """
+        digest = audio.schedule_cache.file_digest(self.filepath)
+        if digest != self.digest:
+            raise ValueError("{} has changed since the replay was recorded".format(self.filepath))
+
+        state_manager = GameStateManager(headless=True)
+        state_manager.reset(rate=self.rate, filepath=self.filepath)
+        frames = [0]
+        states = [self._ball_state(state_manager)]
+
+        for note, angle in enumerate(self.angles):
+            self._run_to_decision(state_manager)
+            if not state_manager.awaiting_action:
+                raise ValueError("replay ended at note {} of {}".format(note, len(self.angles)))
+            if not state_manager.action_mask[angle]:
+                raise ValueError("angle {} is not allowed at note {}, the replay does not match this version of the game".format(angle, note))
+            state_manager.step(int(angle))
+            # after the bounce and the first frame of the new arc
+            frames.append(self._frame(state_manager))
+            states.append(self._ball_state(state_manager))
+        self._run_to_decision(state_manager)
+
+        self.completed = state_manager.completed
+        self.end_frame = self._frame(state_manager)
+        self._keyframes = (np.array(frames, dtype=np.uint32), np.array(states, dtype=np.float64))
+        return state_manager
+
+    def keyframes(self):
+        """
+        (frames, states): frame numbers, ascending, and the ball's (x, y, vx, vy)
+        on each of them.
+        """
+        if self._keyframes is None:
+            self.simulate()
+        return self._keyframes
+
+    def seek(self, time):
+        """
+        Ball position at time seconds after the fall, clamped to the run.
+
+        :return: (x, y)
+        """
+        frames, states = self.keyframes()
+        frame = min(max(int(time * FPS + 1e-9), 0), self.end_frame)
+        index = int(np.searchsorted(frames, frame, side='right')) - 1
+        x, y, vx, vy = states[index].tolist()
+        # exactly the float operations of Ball.update, so the positions match
+        # the recorded run to the bit
+        gravity = self._gravity()
+        for _ in range(frame - int(frames[index])):
+            x += vx
+            y += vy
+            vy = vy - gravity
+        return x, y
+
+    def save(self, path, keyframes=True):
+        with open(path, 'wb') as f:
+            f.write(self.encode(keyframes))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.decode(f.read())
+
+    def encode(self, keyframes=True):
+        """
+        The header, the song path in utf-8, one uint16 per angle, then for every
+        keyframe a uint32 frame and four float64 ball values.
+        """
+        path = self.filepath.encode('utf-8')
+        frames, states = self.keyframes() if keyframes else (np.zeros(0, dtype=np.uint32), np.zeros((0, 4)))
+        flags = COMPLETED if self.completed else 0
+        header = HEADER.pack(MAGIC, VERSION, flags, self.rate, self.end_frame, len(self.angles), len(frames),
+                             bytes.fromhex(self.digest), len(path))
+        return (header + path + self.angles.astype('<u2').tobytes()
+                + frames.astype('<u4').tobytes() + states.astype('<f8').tobytes())
+
+    @classmethod
+    def decode(cls, data):
+        magic, version, flags, rate, end_frame, num_angles, num_keyframes, digest, path_length = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a version {} replay file".format(VERSION))
+
+        if rate.is_integer():
+            # reset scales the velocity tuple by the rate, keep whole rates ints
+            rate = int(rate)
+
+        offset = HEADER.size
+        filepath = data[offset:offset + path_length].decode('utf-8')
+        offset += path_length
+        angles = np.frombuffer(data, dtype='<u2', count=num_angles, offset=offset)
+        offset += 2 * num_angles
+        if len(data) != offset + 36 * num_keyframes:
+            raise ValueError("truncated replay file")
+
+        keyframes = None
+        if num_keyframes:
+            frames = np.frombuffer(data, dtype='<u4', count=num_keyframes, offset=offset)
+            offset += 4 * num_keyframes
+            states = np.frombuffer(data, dtype='<f8', count=4 * num_keyframes, offset=offset).reshape(-1, 4)
+            keyframes = (frames.astype(np.uint32), states.astype(np.float64))
+        return cls(filepath, rate, angles, completed=bool(flags & COMPLETED), end_frame=end_frame,
+                   digest=digest.hex(), keyframes=keyframes)
+
+    def _gravity(self):
+        return GRAVITY * self.rate
+
+    @staticmethod
+    def _run_to_decision(state_manager):
+        while not state_manager.terminated and not state_manager.awaiting_action:
+            state_manager.step(None)
+
+    @staticmethod
+    def _frame(state_manager):
+        # frames the ball has moved since the fall, pauses left out
+        elapsed = state_manager.clock.time() - state_manager.start_time - state_manager.playback_controls["total_paused_duration"]
+        return int(round(elapsed * FPS))
+
+    @staticmethod
+    def _ball_state(state_manager):
+        ball = state_manager.ball
+        return (ball.x, ball.y, ball.velocity[0], ball.velocity[1])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Watch a recorded replay.")
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    replay = Replay.load(args.path)
+    print("{}: {} notes placed, {}, {:.1f}s".format(os.path.basename(replay.filepath), len(replay.angles),
+                                                  "completed" if replay.completed else "failed", replay.duration))
+    replay.simulate().init_playback()
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from note_schedule import NoteSchedule
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.schedule_cache')
+
+# file header: magic, format version, number of chord groups, number of notes
+HEADER = struct.Struct('<4sHII')
+MAGIC = b'GMSC'
+# 2: tempo changes apply across tracks, older files are parsed again
+VERSION = 2
+
+def encode_schedule(schedule):
+    """
+    Pack a NoteSchedule into the compact on-disk form: the header, one float64
+    time and one uint32 note count per group, then channel, note and velocity
+    bytes for every note.
+    """
+    notes = np.stack([schedule.channels, schedule.pitches, schedule.velocities], axis=1)
+    return (HEADER.pack(MAGIC, VERSION, len(schedule), schedule.num_notes)
+            + schedule.onsets.astype('<f8').tobytes()
+            + np.diff(schedule.offsets).astype('<u4').tobytes()
+            + notes.astype(np.uint8).tobytes())
+
+def decode_schedule(data):
+    magic, version, num_groups, num_notes = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a version {} schedule file".format(VERSION))
+
+    offset = HEADER.size
+    if len(data) != offset + 12 * num_groups + 3 * num_notes:
+        raise ValueError("truncated schedule file")
+    times = np.frombuffer(data, dtype='<f8', count=num_groups, offset=offset)
+    offset += 8 * num_groups
+    counts = np.frombuffer(data, dtype='<u4', count=num_groups, offset=offset)
+    offset += 4 * num_groups
+    notes = np.frombuffer(data, dtype=np.uint8, count=3 * num_notes, offset=offset).reshape(-1, 3)
+
+    offsets = np.zeros(num_groups + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return NoteSchedule(times, offsets, notes[:, 1], notes[:, 2], notes[:, 0])
+
+class ScheduleCache:
+    """
+    Cache of parsed note schedules keyed by MIDI file content and grouping
+    tolerance: an in-memory LRU in front of a directory of encoded schedules.
+
+    File contents are hashed at most once per (mtime, size) of the file, so a
+    hit costs a stat call and a dictionary lookup, and editing the file
+    invalidates its entries.
+    """
+    def __init__(self, max_entries=32, cache_dir=DEFAULT_CACHE_DIR):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def file_digest(self, path):
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        known = self._digests.get(path)
+        if known is not None and known[0] == signature:
+            return known[1]
+
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        self._digests[path] = (signature, digest)
+        return digest
+
+    def get(self, path, tolerance, build):
+        """
+        The NoteSchedule for path, calling build(path, tolerance) only if neither
+        the memory nor the disk cache has it. Schedules are read-only, the same
+        one is returned to every caller.
+        """
+        key = (self.file_digest(path), tolerance)
+        with self._lock:
+            schedule = self._entries.get(key)
+            if schedule is not None:
+                self._entries.move_to_end(key)
+                return schedule
+
+        schedule = self._load(key)
+        if schedule is None:
+            schedule = build(path, tolerance)
+            self._store(key, schedule)
+
+        with self._lock:
+            self._entries[key] = schedule
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return schedule
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+
+    def _disk_path(self, key):
+        digest, tolerance = key
+        return os.path.join(self.cache_dir, "{}-{!r}.sched".format(digest, tolerance))
+
+    def _load(self, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return decode_schedule(f.read())
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def _store(self, key, schedule):
+        if self.cache_dir is None:
+            return
+        # write then rename so concurrent readers never see half a file
+        path = self._disk_path(key)
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temporary, 'wb') as f:
+                f.write(encode_schedule(schedule))
+            os.replace(temporary, path)
+        except OSError:
+            pass
@@ -7,6 +7,13 @@ CAMERA_CENTER = SCREEN_HEIGHT/3
 INITIAL_X = SCREEN_WIDTH/2
 INITIAL_Y = 100
 INITIAL_VELOCITY = (0,0)
+BALL_RADIUS = 15
+GRAVITY = -0.3
+RESTITUTION = 0.8
+
+# platform settings
+PLATFORM_LENGTH = 50
+PLATFORM_WIDTH = 10
 
 # Colors
 BLACK = (0, 0, 0)
@@ -0,0 +1,215 @@
+import multiprocessing as mp
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper
+
+from vec_env import BuilderVecEnv, NUM_ANGLES
+
+def _layout(observation_space, num_envs):
+    # name -> (byte offset, shape, dtype) of every array in the shared block
+    arrays = []
+    for key, space in observation_space.spaces.items():
+        arrays.append(("obs_" + key, (num_envs, *space.shape), space.dtype))
+        arrays.append(("terminal_" + key, (num_envs, *space.shape), space.dtype))
+    arrays += [
+        ("actions", (num_envs,), np.dtype(np.int64)),
+        ("rewards", (num_envs,), np.dtype(np.float32)),
+        ("dones", (num_envs,), np.dtype(bool)),
+        ("masks", (num_envs, NUM_ANGLES), np.dtype(np.int8)),
+    ]
+
+    layout = {}
+    offset = 0
+    for name, shape, dtype in arrays:
+        dtype = np.dtype(dtype)
+        offset = -(-offset // 64) * 64  # keep every array cache line aligned
+        layout[name] = (offset, shape, dtype)
+        offset += int(np.prod(shape)) * dtype.itemsize
+    return layout, max(offset, 1)
+
+def _views(shm, layout):
+    return {name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset) for name, (offset, shape, dtype) in layout.items()}
+
+def _worker(remote, parent_remote, shm_name, layout, start, stop, env_fn_wrapper):
+    parent_remote.close()
+    shm = SharedMemory(name=shm_name)
+    buffers = _views(shm, layout)
+    keys = [name[len("obs_"):] for name in layout if name.startswith("obs_")]
+    env = env_fn_wrapper.var()
+
+    def write(observations):
+        for key in keys:
+            buffers["obs_" + key][start:stop] = observations[key]
+        buffers["masks"][start:stop] = env.action_masks()
+
+    try:
+        while True:
+            command, data = remote.recv()
+            if command == "step":
+                observations, rewards, dones, infos = env.step(buffers["actions"][start:stop])
+                buffers["rewards"][start:stop] = rewards
+                buffers["dones"][start:stop] = dones
+                for i in np.nonzero(dones)[0]:
+                    for key in keys:
+                        buffers["terminal_" + key][start + i] = infos[i]["terminal_observation"][key]
+                write(observations)
+                remote.send(None)
+            elif command == "reset":
+                write(env.reset())
+                remote.send(None)
+            elif command == "get_attr":
+                remote.send(env.get_attr(data))
+            elif command == "set_attr":
+                remote.send(env.set_attr(*data))
+            elif command == "env_method":
+                name, args, kwargs = data
+                remote.send(env.env_method(name, *args, **kwargs))
+            elif command == "close":
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        env.close()
+        del buffers
+        shm.close()
+        remote.close()
+
+class SharedMemoryVecEnv(VecEnv):
+    """
+    Runs BuilderVecEnv shards in headless worker processes, one per core.
+
+    Actions, observations, rewards, dones, terminal observations and action
+    masks travel through one shared memory block laid out as NumPy arrays;
+    the pipes to the workers only carry one-word commands.
+
+    :param num_workers: Number of worker processes.
+    :param envs_per_worker: Episodes simulated by the BuilderVecEnv in each worker.
+    :param env_fn: Builds a worker's shard from its episode count, BuilderVecEnv
+                   for the default song by default; must be picklable.
+    :param start_method: multiprocessing start method, forkserver where available.
+    """
+    def __init__(self, num_workers, envs_per_worker=8, env_fn=BuilderVecEnv, start_method=None):
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        context = mp.get_context(start_method)
+
+        # the parent needs the spaces before any worker is up
+        probe = env_fn(1)
+        observation_space, action_space = probe.observation_space, probe.action_space
+        probe.close()
+
+        num_envs = num_workers * envs_per_worker
+        self._layout, size = _layout(observation_space, num_envs)
+        self._shm = SharedMemory(create=True, size=size)
+        self._buffers = _views(self._shm, self._layout)
+        self._keys = list(observation_space.spaces.keys())
+        self._slices = [slice(i * envs_per_worker, (i + 1) * envs_per_worker) for i in range(num_workers)]
+
+        self.remotes, self.processes = [], []
+        for shard in self._slices:
+            remote, work_remote = context.Pipe()
+            args = (work_remote, remote, self._shm.name, self._layout, shard.start, shard.stop,
+                    CloudpickleWrapper(partial(env_fn, envs_per_worker)))
+            process = context.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+        self.closed = False
+        self.waiting = False
+        super().__init__(num_envs, observation_space, action_space)
+
+    def _observations(self, prefix="obs_"):
+        return {key: self._buffers[prefix + key].copy() for key in self._keys}
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(("reset", None))
+        for remote in self.remotes:
+            remote.recv()
+        self.reset_infos = [{"action_mask": mask} for mask in self.action_masks()]
+        return self._observations()
+
+    def step_async(self, actions):
+        self._buffers["actions"][:] = np.asarray(actions).reshape(self.num_envs)
+        for remote in self.remotes:
+            remote.send(("step", None))
+        self.waiting = True
+
+    def step_wait(self):
+        for remote in self.remotes:
+            remote.recv()
+        self.waiting = False
+
+        dones = self._buffers["dones"].copy()
+        infos = [{"action_mask": mask} for mask in self.action_masks()]
+        for i in np.nonzero(dones)[0]:
+            infos[i]["terminal_observation"] = {key: self._buffers["terminal_" + key][i].copy() for key in self._keys}
+            infos[i]["TimeLimit.truncated"] = False
+        return self._observations(), self._buffers["rewards"].copy(), dones, infos
+
+    def action_masks(self):
+        return self._buffers["masks"].astype(bool)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        del self._buffers
+        self._shm.close()
+        self._shm.unlink()
+        self.closed = True
+
+    def _indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
+
+    def _workers(self, indices):
+        # (worker, local indices) pairs for the requested global env indices
+        indices = self._indices(indices)
+        for remote, shard in zip(self.remotes, self._slices):
+            local = [i - shard.start for i in indices if shard.start <= i < shard.stop]
+            if local:
+                yield remote, local
+
+    def get_attr(self, attr_name, indices=None):
+        results = []
+        for remote, local in self._workers(indices):
+            remote.send(("get_attr", attr_name))
+            values = remote.recv()
+            results += [values[i] for i in local]
+        return results
+
+    def set_attr(self, attr_name, value, indices=None):
+        for remote, _ in self._workers(indices):
+            remote.send(("set_attr", (attr_name, value)))
+            remote.recv()
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        # masks are already in shared memory, MaskablePPO asks for them every step
+        if method_name == "action_masks":
+            masks = self.action_masks()
+            return [masks[i] for i in self._indices(indices)]
+
+        results = []
+        for remote, local in self._workers(indices):
+            remote.send(("env_method", (method_name, method_args, method_kwargs)))
+            values = remote.recv()
+            results += [values[i] for i in local]
+        return results
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _, local in self._workers(indices) for _ in local]
@@ -0,0 +1,42 @@
+import time
+import pygame
+
+from settings import FPS
+
+class WallClock:
+    """
+    Real-time clock: timestamps come from time.time() and tick() throttles
+    through pygame.time.Clock, exactly like the interactive game.
+    """
+    def __init__(self):
+        self._clock = pygame.time.Clock()
+
+    def time(self):
+        return time.time()
+
+    def tick(self, framerate=0):
+        return self._clock.tick(framerate)
+
+    def get_fps(self):
+        return self._clock.get_fps()
+
+class SimulatedClock:
+    """
+    Headless clock: every tick advances time by exactly 1/fps and never waits.
+
+    Time is kept as an integer frame count so note timing does not drift from
+    repeated float additions.
+    """
+    def __init__(self, fps=FPS):
+        self.fps = fps
+        self.frames = 0
+
+    def time(self):
+        return self.frames / self.fps
+
+    def tick(self, framerate=0):
+        self.frames += 1
+        return int(1000 / self.fps)
+
+    def get_fps(self):
+        return float(self.fps)
@@ -0,0 +1,124 @@
+import glob
+import math
+import os
+import queue
+import random
+import threading
+import warnings
+
+import audio
+
+SAMPLING_MODES = ('uniform', 'weighted', 'curriculum')
+
+class SongSampler:
+    """
+    Picks the song for every episode from a directory of .mid files.
+
+    A daemon thread chooses the songs and parses their schedules ahead of time
+    into a bounded queue, so sample() normally returns at once and reset never
+    waits for file I/O or mido. Files that fail to parse are dropped from
+    paths with a warning. episodes counts the songs sample() has returned.
+
+    :param directory: Directory searched (recursively) for .mid files.
+    :param mode: 'uniform', 'weighted' (by the weights argument) or 'curriculum',
+                 which starts with the shortest songs and widens the pool to all
+                 of them over curriculum_episodes episodes.
+    :param weights: For 'weighted', a dict from file name (relative to directory)
+                    to weight; songs left out weigh 1.
+    :param curriculum_episodes: Episodes until the curriculum reaches every song.
+    :param prefetch: Schedules kept ready.
+    :param seed: Seed for the sampler's own random generator.
+    """
+    def __init__(self, directory, mode='uniform', weights=None, curriculum_episodes=1000, prefetch=8, seed=None):
+        if mode not in SAMPLING_MODES:
+            raise ValueError("mode must be one of {}".format(", ".join(SAMPLING_MODES)))
+        self.paths = sorted(glob.glob(os.path.join(directory, '**', '*.mid'), recursive=True))
+        if not self.paths:
+            raise ValueError("no .mid files in {}".format(directory))
+
+        self.directory = directory
+        self.mode = mode
+        self.curriculum_episodes = curriculum_episodes
+        self.weights = [1] * len(self.paths)
+        if weights:
+            self.weights = [weights.get(os.path.relpath(path, directory), 1) for path in self.paths]
+        self.episodes = 0
+
+        self._random = random.Random(seed)
+        self._queue = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._prefetch, daemon=True)
+        self._thread.start()
+
+    def sample(self):
+        """
+        (path, schedule) for the next episode, schedule being the song's shared
+        NoteSchedule, as returned by audio.create_global_event_queue.
+
+        Raises RuntimeError once no more songs can come, because every file
+        failed to parse or the sampler was closed.
+        """
+        while True:
+            try:
+                item = self._queue.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if not self._thread.is_alive() and self._queue.empty():
+                    raise RuntimeError("the song sampler has stopped")
+        if isinstance(item, Exception):
+            raise item
+        self.episodes += 1
+        return item
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _prefetch(self):
+        if self.mode == 'curriculum':
+            # shortest first, by the time of the last note
+            lengths = {}
+            for path in list(self.paths):
+                schedule = self._parse(path)
+                if schedule is not None:
+                    lengths[path] = schedule.duration
+            self.paths.sort(key=lengths.get)
+
+        while not self._stop.is_set():
+            if not self.paths:
+                self._put(ValueError("no readable .mid files in {}".format(self.directory)))
+                return
+            # episodes handed out so far, the queue is filled ahead of them
+            path = self._choose(self.episodes)
+            schedule = self._parse(path)
+            if schedule is not None:
+                self._put((path, schedule))
+
+    def _put(self, item):
+        # wait for room without missing close()
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _parse(self, path):
+        # the song's schedule, or None after dropping a file that won't parse
+        try:
+            return audio.create_global_event_queue(path)
+        except Exception as error:
+            warnings.warn("skipping {}: {!r}".format(path, error))
+            index = self.paths.index(path)
+            del self.paths[index]
+            del self.weights[index]
+            return None
+
+    def _choose(self, episodes):
+        if self.mode == 'weighted':
+            return self._random.choices(self.paths, weights=self.weights)[0]
+        if self.mode == 'curriculum':
+            progress = min(1, episodes / self.curriculum_episodes)
+            return self._random.choice(self.paths[:max(1, math.ceil(progress * len(self.paths)))])
+        return self._random.choice(self.paths)
@@ -0,0 +1,46 @@
+import os
+import sys
+
+# no window or sound card needed
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+# the modules live at the top of the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mido
+import pytest
+
+def write_tracks(path, tracks, ticks_per_beat=480, midi_type=1):
+    """
+    Write a MIDI file.
+
+    :param tracks: One list of (tick, message) per track, in any order.
+    """
+    midi = mido.MidiFile(type=midi_type, ticks_per_beat=ticks_per_beat)
+    for events in tracks:
+        track = mido.MidiTrack()
+        now = 0
+        for tick, message in sorted(events, key=lambda event: event[0]):
+            track.append(message.copy(time=tick - now))
+            now = tick
+        midi.tracks.append(track)
+    midi.save(path)
+    return str(path)
+
+def write_song(path, notes, ticks_per_beat=480):
+    """
+    Write a one track MIDI file.
+
+    :param notes: List of (tick, pitch) note onsets, each note lasting half a beat.
+    """
+    events = []
+    for tick, pitch in notes:
+        events.append((tick, mido.Message('note_on', note=pitch, velocity=64)))
+        events.append((tick + ticks_per_beat // 2, mido.Message('note_off', note=pitch, velocity=0)))
+    return write_tracks(path, [events], ticks_per_beat, midi_type=0)
+
+@pytest.fixture
+def song(tmp_path):
+    # a scale, one note a beat
+    return write_song(tmp_path / "scale.mid", [(480 * (i + 1), 60 + i) for i in range(12)])
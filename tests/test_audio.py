@@ -0,0 +1,54 @@
+import mido
+import numpy as np
+
+import audio
+from conftest import write_tracks
+
+def note(tick, pitch, channel=0, velocity=64):
+    return tick, mido.Message('note_on', note=pitch, channel=channel, velocity=velocity)
+
+def tempo(tick, bpm):
+    return tick, mido.MetaMessage('set_tempo', tempo=mido.bpm2tempo(bpm))
+
+def mido_notes(path):
+    # (seconds, channel, note, velocity) of every note_on, by mido's own merge
+    notes = []
+    now = 0.0
+    for msg in mido.MidiFile(path):
+        now += msg.time
+        if msg.type == 'note_on' and msg.velocity > 0:
+            notes.append((now, msg.channel, msg.note, msg.velocity))
+    return notes
+
+def test_multi_track_tempo_changes_match_mido(tmp_path):
+    path = write_tracks(tmp_path / "tracks.mid", [
+        # conductor track: starts at the default tempo, then two changes
+        [tempo(200, 90), tempo(500, 150)],
+        [note(0, 60), note(96, 62), note(200, 64), note(350, 65, velocity=90), note(500, 67), note(700, 69)],
+        # same ticks as track 1 (ties), a note off (velocity 0) and a tempo change of its own
+        [note(96, 48, channel=1), note(200, 50, channel=1), note(210, 50, channel=1, velocity=0),
+         note(500, 52, channel=1), tempo(600, 60), note(650, 53, channel=1), note(700, 55, channel=1)],
+        [note(700, 36, channel=9, velocity=100)],
+    ], ticks_per_beat=96)
+
+    schedule = audio.parse_global_event_queue(path, tolerance=0)
+    expected = mido_notes(path)
+
+    times = np.repeat(schedule.onsets, np.diff(schedule.offsets))
+    assert np.allclose(times, [seconds for seconds, _, _, _ in expected], rtol=0, atol=1e-9)
+    assert schedule.channels.tolist() == [channel for _, channel, _, _ in expected]
+    assert schedule.pitches.tolist() == [pitch for _, _, pitch, _ in expected]
+    assert schedule.velocities.tolist() == [velocity for _, _, _, velocity in expected]
+
+    # notes at the same tick in different tracks share a group, in track order
+    last = schedule.group(len(schedule) - 1)
+    assert schedule.pitches[last].tolist() == [69, 55, 36]
+
+def test_tempo_map_segments():
+    ticks, seconds, scales = audio.tempo_map([(100, 250000), (100, 1000000), (300, 500000)], 100)
+    assert ticks.tolist() == [0, 100, 300]
+    # a later change at the same tick wins
+    assert np.allclose(scales, [0.005, 0.01, 0.005])
+    assert np.allclose(seconds, [0, 0.5, 2.5])
+    assert np.allclose(audio.ticks_to_seconds(np.array([0, 50, 100, 200, 400]), (ticks, seconds, scales)),
+                       [0, 0.25, 0.5, 1.5, 3.0])
@@ -0,0 +1,28 @@
+import pytest
+
+from broadphase import GridStore, PlatformIndex
+from trail import TrailStore
+
+def test_grid_store_is_abstract():
+    with pytest.raises(TypeError):
+        GridStore(4, 64, 16)
+
+def test_subclass_without_box_is_rejected():
+    class Points(GridStore):
+        def _boxes(self, rows):
+            return rows[:, [0, 1, 0, 1]]
+
+    with pytest.raises(TypeError, match="_box"):
+        Points(2, 64, 16)
+
+def test_stores_implement_every_box():
+    TrailStore()
+    PlatformIndex()
+
+def test_subclass_without_boxes_is_rejected():
+    class Points(GridStore):
+        def _box(self, row):
+            return row[0], row[1], row[0], row[1]
+
+    with pytest.raises(TypeError, match="_boxes"):
+        Points(2, 64, 16)
@@ -0,0 +1,21 @@
+import numpy as np
+
+from game_env import BuilderEnvironment
+
+def test_observations_are_not_overwritten(song):
+    env = BuilderEnvironment(macro_step=True)
+    env.state_manager.reset(rate=1, filepath=song)
+    env._run_to_decision()
+    first = env._get_obs()
+    kept = {key: value.copy() for key, value in first.items()}
+
+    for _ in range(4):
+        env.step(int(np.flatnonzero(env.action_masks())[0]))
+    latest = env._get_obs()
+
+    for key in kept:
+        assert np.array_equal(first[key], kept[key])
+        assert not np.shares_memory(first[key], latest[key])
+    assert not np.array_equal(first["agent"], latest["agent"])
+    assert latest["platforms"].any()
+    env.close()
@@ -0,0 +1,22 @@
+import numpy as np
+
+from game_env import BuilderEnvironment
+from settings import SCREEN_WIDTH, SCREEN_HEIGHT
+
+def test_render_while_previous_frame_is_held(song):
+    env = BuilderEnvironment(render_mode="rgb_array", macro_step=True)
+    env.state_manager.reset(rate=1, filepath=song)
+    env._run_to_decision()
+    for _ in range(3):
+        env.step(int(np.flatnonzero(env.action_masks())[0]))
+    assert env.state_manager.platforms
+
+    first = env.render()
+    env.step(int(np.flatnonzero(env.action_masks())[0]))
+    second = env.render()
+
+    assert first.shape == second.shape == (SCREEN_HEIGHT, SCREEN_WIDTH, 3)
+    assert first.dtype == np.uint8
+    assert not np.shares_memory(first, second)
+    assert first.any() and second.any()
+    env.close()
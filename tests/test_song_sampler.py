@@ -0,0 +1,45 @@
+import pytest
+
+from conftest import write_song
+from song_sampler import SongSampler
+
+@pytest.mark.filterwarnings("ignore:skipping")
+def test_unreadable_songs_are_skipped(tmp_path):
+    good = write_song(tmp_path / "good.mid", [(480, 60), (960, 62)])
+    (tmp_path / "broken.mid").write_bytes(b"MThd\x00\x00")
+
+    sampler = SongSampler(str(tmp_path), prefetch=2, seed=0)
+    paths = [sampler.sample()[0] for _ in range(10)]
+    assert paths == [good] * 10
+    assert sampler.episodes == 10
+    assert sampler.paths == [good]
+    sampler.close()
+
+@pytest.mark.filterwarnings("ignore:skipping")
+def test_no_readable_songs_raises_instead_of_blocking(tmp_path):
+    (tmp_path / "broken.mid").write_bytes(b"MThd\x00\x00")
+
+    sampler = SongSampler(str(tmp_path), prefetch=2)
+    with pytest.raises(ValueError):
+        sampler.sample()
+    with pytest.raises(RuntimeError):
+        sampler.sample()
+    sampler.close()
+
+def test_close_with_full_queue(tmp_path):
+    write_song(tmp_path / "song.mid", [(480, 60)])
+
+    sampler = SongSampler(str(tmp_path), prefetch=1)
+    sampler.sample()
+    sampler.close()
+    with pytest.raises(RuntimeError):
+        sampler.sample()
+
+def test_curriculum_counts_sampled_episodes(tmp_path):
+    short = write_song(tmp_path / "short.mid", [(480, 60)])
+    write_song(tmp_path / "long.mid", [(480 * (i + 1), 60) for i in range(20)])
+
+    # the first quarter of the curriculum only has the shorter song
+    sampler = SongSampler(str(tmp_path), mode='curriculum', curriculum_episodes=40, prefetch=8, seed=0)
+    assert [sampler.sample()[0] for _ in range(10)] == [short] * 10
+    sampler.close()
@@ -0,0 +1,13 @@
+import pytest
+
+from trail import TrailStore
+
+@pytest.mark.parametrize("max_frames", [1, 2, 3, 10])
+def test_max_frames_bounds_the_record(max_frames):
+    trail = TrailStore(max_frames=max_frames)
+    for i in range(50):
+        trail.append((100 * i, 100 * i, i / 60, 60))
+        assert len(trail) <= max_frames
+    # the newest frame is always kept
+    assert tuple(trail[-1]) == (4900, 4900, 49 / 60, 60)
+    assert trail.grid.query(4900, 4900, 4900, 4900).tolist() == [len(trail) - 1]
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from ball import Ball
+from bounce_platform import platform_rects, rect_distance
+from trajectory import BallisticPath, sweep_hits_rects, _closest_approach, _cubic_roots
+
+GRAVITY = 0.5
+RADIUS = 10
+LENGTH, WIDTH = 80, 10
+
+def ball_positions(origin, velocity, gravity, frames):
+    ball = Ball(x=origin[0], y=origin[1], radius=RADIUS, color=None, outline_color=None,
+                velocity=tuple(velocity), gravity=gravity, restitution=1)
+    positions = []
+    for _ in range(frames):
+        ball.update()
+        positions.append((ball.x, ball.y))
+    return np.array(positions)
+
+def test_path_passes_through_every_frame():
+    path = BallisticPath.from_frame_steps((100, 200), (3.5, 7), GRAVITY, 60)
+    assert np.allclose(path.positions(np.arange(1, 61)), ball_positions((100, 200), (3.5, 7), GRAVITY, 60),
+                       rtol=0, atol=1e-9)
+
+def test_sweep_matches_dense_sampling():
+    rng = np.random.default_rng(0)
+    num_paths, num_rects, frames = 200, 40, 30
+    origins = rng.uniform(0, 400, (num_paths, 2))
+    velocities = rng.uniform(-10, 10, (num_paths, 2))
+    path = BallisticPath.from_frame_steps(origins, velocities, GRAVITY, np.full(num_paths, float(frames)))
+    centers, normals, tangents = platform_rects(rng.uniform(0, 400, num_rects), rng.uniform(0, 400, num_rects),
+                                                rng.uniform(0, 360, num_rects), RADIUS, LENGTH, WIDTH)
+
+    hits = path.hits_rects(centers, normals, tangents, LENGTH, WIDTH, RADIUS)
+
+    # closest sampled distance, 100 samples a frame plus the start
+    times = np.linspace(0, frames, 100 * frames + 1)
+    points = path.positions(times)[:, :, None, :]
+    distance = rect_distance(points, centers, normals, tangents, LENGTH, WIDTH).min(axis=1)
+    # the path moves less than 0.3px between samples, only decide clear cases
+    clear = np.abs(distance - RADIUS) > 0.5
+    assert clear.mean() > 0.9
+    assert np.array_equal(hits[clear], (distance <= RADIUS)[clear])
+
+    # every frame Ball.update stops on that touches a rectangle is a hit
+    for i in range(num_paths):
+        positions = ball_positions(origins[i], velocities[i], GRAVITY, frames)[:, None, :]
+        touching = (rect_distance(positions, centers, normals, tangents, LENGTH, WIDTH) <= RADIUS).any(axis=0)
+        assert not (touching & ~hits[i]).any()
+
+def flat_rect():
+    # horizontal platform centered on the origin: normal along y, tangent along x
+    return np.array([0.0, 0.0]), np.array([0.0, 1.0]), np.array([1.0, 0.0])
+
+@pytest.mark.parametrize("scale, expected", [(1 + 1e-9, True), (1 - 1e-7, False)])
+def test_tangent_to_a_side(scale, expected):
+    # the arc's highest point right below the middle of the bottom face, the
+    # radius away from it
+    center, normal, tangent = flat_rect()
+    apex = np.array([0.0, -WIDTH / 2 - RADIUS])
+    t = 10.0
+    velocity = np.array([3.0, GRAVITY * t])
+    origin = apex - velocity * t - np.array([0.0, -GRAVITY]) * t ** 2 / 2
+    hit = sweep_hits_rects(origin, velocity, np.array([0.0, -GRAVITY]), 2 * t,
+                           center, normal, tangent, LENGTH, WIDTH, RADIUS * scale)
+    assert bool(hit) is expected
+
+@pytest.mark.parametrize("scale, expected", [(1 + 1e-9, True), (1 - 1e-7, False)])
+def test_tangent_to_a_corner(scale, expected):
+    # platform turned 45 degrees so a corner points straight up, and a flat
+    # arc whose apex is the radius above it; only the corner disk is touched
+    center = np.array([0.0, 0.0])
+    normal = np.array([1.0, 1.0]) / np.sqrt(2)
+    tangent = np.array([-1.0, 1.0]) / np.sqrt(2)
+    corner = center + normal * WIDTH / 2 + tangent * LENGTH / 2
+    apex = corner + np.array([0.0, RADIUS])
+    t = 10.0
+    velocity = np.array([20.0, GRAVITY * t])
+    acceleration = np.array([0.0, -GRAVITY])
+    origin = apex - velocity * t - acceleration * t ** 2 / 2
+    hit = sweep_hits_rects(origin, velocity, acceleration, 2 * t, center, normal, tangent, LENGTH, WIDTH, RADIUS * scale)
+    assert bool(hit) is expected
+
+@pytest.mark.parametrize("coefficients, roots", [
+    ((1, 0, -3, 2), [-2, 1, 1]),    # (t - 1)^2 (t + 2), a double root
+    ((2, -6, 6, -2), [1, 1, 1]),    # 2 (t - 1)^3
+    ((1, -6, 11, -6), [1, 2, 3]),
+])
+def test_cubic_roots_repeated(coefficients, roots):
+    found = np.array(_cubic_roots(*[np.float64(c) for c in coefficients]))
+    assert np.allclose(found.imag, 0, atol=1e-6)
+    assert np.allclose(np.sort(found.real), roots, atol=1e-6)
+
+def test_cubic_roots_match_numpy():
+    rng = np.random.default_rng(1)
+    coefficients = rng.uniform(-5, 5, (4, 500))
+    coefficients[0] += np.where(coefficients[0] >= 0, 0.1, -0.1)
+    found = np.stack(_cubic_roots(*coefficients), axis=-1)
+    for i in range(coefficients.shape[1]):
+        expected = np.roots(coefficients[:, i])
+        # every numpy root has a match among ours
+        assert np.abs(found[i][:, None] - expected[None, :]).min(axis=0).max() < 1e-6
+
+def test_closest_approach_matches_dense_sampling():
+    rng = np.random.default_rng(2)
+    x0, x1, x2, y0, y1, y2 = rng.uniform(-5, 5, (6, 1000))
+    duration = rng.uniform(0.1, 3, 1000)
+
+    best = _closest_approach(x0, x1, x2, y0, y1, y2, duration)
+
+    t = np.linspace(0, 1, 20001)[:, None] * duration
+    sampled = ((x0 + x1 * t + x2 * t ** 2) ** 2 + (y0 + y1 * t + y2 * t ** 2) ** 2).min(axis=0)
+    assert (best <= sampled + 1e-9).all()
+    assert np.allclose(best, sampled, rtol=1e-6, atol=1e-6)
+
+def test_closest_approach_inside_the_interval():
+    # a parabola through (0, 1) with its vertex there at t = 1, farther at both ends
+    best = _closest_approach(np.float64(-1), np.float64(1), np.float64(0), np.float64(2), np.float64(-2), np.float64(1), 2.0)
+    assert best == pytest.approx(1)
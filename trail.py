@@ -0,0 +1,98 @@
+import numpy as np
+
+from broadphase import GridStore
+
+class TrailStore(GridStore):
+    """
+    Record of the ball for every frame: position, time and frame rate
+    (x, y, t, fps), kept in a growable array with amortized doubling and
+    indexed by a UniformGrid so the samples near a point can be found without
+    walking the whole history. It replaces the frame_data and fps_data lists.
+
+    Indexing and iteration yield rows of the underlying array, so it can stand
+    in for the old list of (x, y, t) tuples, and positions(), times() and
+    fps() are views with no copy.
+
+    For memory-bounded runs, decimation keeps one frame in every decimation
+    and max_frames drops the oldest half of the record whenever it is full.
+    Both thin out the history the action mask checks against, so masks become
+    approximate.
+
+    :param cell_size: Grid cell size in pixels.
+    :param capacity: Initial number of rows.
+    :param max_frames: Most rows kept, None for no limit.
+    :param decimation: Keep every decimation-th frame appended.
+    """
+    def __init__(self, cell_size=64, capacity=1024, max_frames=None, decimation=1):
+        if max_frames is not None:
+            capacity = min(capacity, max_frames)
+        super().__init__(4, cell_size, capacity)
+        self.max_frames = max_frames
+        self.decimation = decimation
+        self.frames = 0
+
+    def __getitem__(self, index):
+        return self._data[:self.count][index]
+
+    def __iter__(self):
+        return iter(self._data[:self.count])
+
+    def _box(self, row):
+        x, y = row[0], row[1]
+        return x, y, x, y
+
+    def _boxes(self, rows):
+        return rows[:, [0, 1, 0, 1]]
+
+    def append(self, frame):
+        """
+        Record a frame, (x, y, t, fps).
+        """
+        self.frames += 1
+        if (self.frames - 1) % self.decimation:
+            return
+        if self.count == self.max_frames:
+            # at least one row, or a max_frames of 1 would never make room
+            self._drop_oldest(max(1, self.count // 2))
+        self._append_row(frame)
+
+    def _drop_oldest(self, number):
+        # rows move down, so ids change and the grid is rebuilt
+        keep = self.count - number
+        self._data[:keep] = self._data[number:self.count]
+        self._stamps[:keep] = self._stamps[number:self.count]
+        self.count = keep
+        self.grid.rebuild(self._boxes(self._data[:keep]))
+
+    def snapshot(self, with_grid=False):
+        return super().snapshot(with_grid) + (self.frames,)
+
+    def restore(self, snapshot):
+        super().restore(snapshot[:-1])
+        self.frames = snapshot[-1]
+
+    def clear(self):
+        super().clear()
+        self.frames = 0
+
+    def positions(self):
+        """
+        (n, 2) view of every recorded position.
+        """
+        return self._data[:self.count, :2]
+
+    def times(self):
+        return self._data[:self.count, 2]
+
+    def fps(self):
+        return self._data[:self.count, 3]
+
+    def query_radius(self, x, y, radius, stop=None):
+        """
+        Ids of the samples within radius of (x, y), optionally only those before stop.
+        """
+        ids = self.grid.query(x - radius, y - radius, x + radius, y + radius)
+        if stop is not None:
+            ids = ids[ids < stop]
+        offsets = self._data[ids, :2] - (x, y)
+        return ids[np.einsum('ij,ij->i', offsets, offsets) <= radius * radius]
@@ -1,7 +1,8 @@
-import gymnasium
-from game_env import BuilderEnvironment
-from gymnasium.envs.registration import register
-from stable_baselines3 import PPO
+from sb3_contrib import MaskablePPO
+from stable_baselines3.common.vec_env import VecMonitor
+from vec_env import BuilderVecEnv
+from shm_vec_env import SharedMemoryVecEnv
+from song_sampler import SongSampler
 
 import os
 import time
@@ -14,24 +15,42 @@ if not os.path.exists(models_dir):
 if not os.path.exists(log_dir):
     os.makedirs(log_dir)
 
-register(
-    id='BuilderEnv',
-    entry_point=lambda: BuilderEnvironment(),
-)
+# worker processes and episodes simulated side by side in each of them;
+# one worker runs the batched env in this process
+NUM_WORKERS = int(os.environ.get('NUM_WORKERS', os.cpu_count() or 1))
+ENVS_PER_WORKER = 16
 
-env = gymnasium.make('BuilderEnv')
-env.reset()
+# one step per note instead of one per frame
+MACRO_STEP = True
 
-model = PPO("MultiInputPolicy", env, verbose=1, tensorboard_log=log_dir)
+# directory of .mid files to sample a song from every episode, None for the default song
+SONG_DIR = os.environ.get('SONG_DIR')
 
 TIMESTEPS = 10000
 
-i = 0
-while True:
-    model.learn(total_timesteps=TIMESTEPS, reset_num_timesteps=False, log_interval=1, tb_log_name=f'PPO_4_{i}')
-    model.save(models_dir + f'/model_4_{i}')
-    print(f'Trained model {i}')
-    i += 1
+def build_env(num_envs):
+    # runs in every worker, the sampler's prefetch thread can't be shared
+    songs = SongSampler(SONG_DIR) if SONG_DIR else None
+    return BuilderVecEnv(num_envs, macro_step=MACRO_STEP, songs=songs)
+
+def make_env():
+    if NUM_WORKERS > 1:
+        return VecMonitor(SharedMemoryVecEnv(NUM_WORKERS, ENVS_PER_WORKER, env_fn=build_env))
+    return VecMonitor(build_env(ENVS_PER_WORKER))
+
+# workers import this module, keep training behind the main guard
+if __name__ == '__main__':
+    env = make_env()
+    env.reset()
+
+    model = MaskablePPO("MultiInputPolicy", env, verbose=1, tensorboard_log=log_dir)
+
+    i = 0
+    while True:
+        model.learn(total_timesteps=TIMESTEPS, reset_num_timesteps=False, log_interval=1, tb_log_name=f'PPO_4_{i}')
+        model.save(models_dir + f'/model_4_{i}')
+        print(f'Trained model {i}')
+        i += 1
 
 # episodes = 10
 
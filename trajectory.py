@@ -0,0 +1,169 @@
+import numpy as np
+
+class BallisticPath:
+    """
+    Closed-form ball trajectory p(t) = origin + velocity*t + acceleration*t^2/2
+    for t in [0, duration], with t measured in frames.
+
+    origin, velocity and duration may carry leading batch dimensions, so one
+    BallisticPath can describe every candidate bounce at once.
+    """
+    def __init__(self, origin, velocity, acceleration, duration):
+        self.origin = np.asarray(origin, dtype=float)
+        self.velocity = np.asarray(velocity, dtype=float)
+        self.acceleration = np.asarray(acceleration, dtype=float)
+        self.duration = np.asarray(duration, dtype=float)
+
+    @classmethod
+    def from_frame_steps(cls, origin, velocity, gravity, duration):
+        """
+        The path traced by Ball.update, which moves by the velocity and then
+        applies gravity once per frame. Its positions after n frames are exactly
+        p0 + n*(v0 + (0, gravity/2)) - (0, gravity)*n^2/2.
+        """
+        velocity = np.array(velocity, dtype=float)
+        velocity[..., 1] += gravity / 2
+        return cls(origin, velocity, (0.0, -gravity), duration)
+
+    def positions(self, times):
+        """
+        Positions at the given times, shape (*batch, len(times), 2).
+        """
+        times = np.asarray(times, dtype=float)[..., None]
+        return self.origin[..., None, :] + self.velocity[..., None, :] * times + self.acceleration * times ** 2 / 2
+
+    def sample(self, time_per_step):
+        """
+        Positions every time_per_step frames after the start, up to the duration.
+        """
+        steps = int(float(np.max(self.duration)) / time_per_step)
+        return self.positions(np.arange(1, steps + 1) * time_per_step)
+
+    def x_range(self):
+        """
+        (min_x, max_x) over the whole path; gravity is vertical so x is linear in time.
+        """
+        start = self.origin[..., 0]
+        end = start + self.velocity[..., 0] * self.duration + self.acceleration[0] * self.duration ** 2 / 2
+        return np.minimum(start, end), np.maximum(start, end)
+
+    def bounds(self):
+        """
+        Axis-aligned bounding boxes (min_x, min_y, max_x, max_y) of each path, shape (*batch, 4).
+        """
+        origin, velocity, duration = np.broadcast_arrays(self.origin, self.velocity, self.duration[..., None])
+        duration = duration[..., 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            apex = np.where(self.acceleration != 0, -velocity / self.acceleration, 0)
+        apex = np.clip(apex, 0, duration[..., None])
+
+        end = origin + velocity * duration[..., None] + self.acceleration * duration[..., None] ** 2 / 2
+        turn = origin + velocity * apex + self.acceleration * apex ** 2 / 2
+        low = np.minimum(np.minimum(origin, end), turn)
+        high = np.maximum(np.maximum(origin, end), turn)
+        return np.concatenate([low, high], axis=-1)
+
+    def hits_rects(self, centers, normals, tangents, length, width, radius):
+        """
+        Exact swept test: does a ball of the given radius moving along the path touch
+        any of the rectangles (as returned by bounce_platform.platform_rects)?
+
+        Rectangles broadcast against the path's batch dimensions after one extra
+        trailing axis is added to the path, so paths of shape (N,) against P
+        rectangles give an (N, P) result.
+        """
+        origin = self.origin[..., None, :]
+        velocity = self.velocity[..., None, :]
+        duration = self.duration[..., None]
+        return sweep_hits_rects(origin, velocity, self.acceleration, duration, centers, normals, tangents, length, width, radius)
+
+def sweep_hits_rects(origin, velocity, acceleration, duration, centers, normals, tangents, length, width, radius):
+    """
+    Array form of BallisticPath.hits_rects; every argument broadcasts.
+
+    The ball touches a rectangle exactly when the path enters the rectangle grown
+    by the ball radius. Unless the path starts inside, it must then cross one of
+    the four straight sides of the grown rectangle (a quadratic in t) or pass
+    through one of the four corner disks (closest approach from a cubic in t).
+    """
+    half_width = np.asarray(width) / 2
+    half_length = np.asarray(length) / 2
+
+    # path in rectangle coordinates: s along the normal, w along the tangent
+    offset = origin - centers
+    s0, s1, s2 = _project(offset, velocity, acceleration, normals)
+    w0, w1, w2 = _project(offset, velocity, acceleration, tangents)
+
+    # starts inside
+    hit = np.zeros(np.broadcast(s0, s1, w0, w1, duration, half_width).shape, dtype=bool)
+    hit |= np.hypot(np.maximum(np.abs(s0) - half_width, 0), np.maximum(np.abs(w0) - half_length, 0)) <= radius
+
+    # crosses a straight side of the grown rectangle
+    for (a0, a1, a2), (b0, b1, b2), limit, extent in (((s0, s1, s2), (w0, w1, w2), half_width + radius, half_length),
+                                                      ((w0, w1, w2), (s0, s1, s2), half_length + radius, half_width)):
+        for side in (limit, -limit):
+            for t in _quadratic_roots(a2, a1, a0 - side):
+                inside = (t >= 0) & (t <= duration)
+                hit |= inside & (np.abs(b0 + b1 * t + b2 * t ** 2) <= extent)
+
+    # passes through a corner disk
+    for corner_s in (half_width, -half_width):
+        for corner_w in (half_length, -half_length):
+            hit |= _closest_approach(s0 - corner_s, s1, s2, w0 - corner_w, w1, w2, duration) <= radius ** 2
+
+    return hit
+
+def _project(offset, velocity, acceleration, axis):
+    # coefficients of (p(t) - center) . axis as c0 + c1*t + c2*t^2
+    c0 = offset[..., 0] * axis[..., 0] + offset[..., 1] * axis[..., 1]
+    c1 = velocity[..., 0] * axis[..., 0] + velocity[..., 1] * axis[..., 1]
+    c2 = (acceleration[..., 0] * axis[..., 0] + acceleration[..., 1] * axis[..., 1]) / 2
+    return c0, c1, c2
+
+def _quadratic_roots(a, b, c):
+    # real roots of a*t^2 + b*t + c, nan where there are none
+    with np.errstate(divide='ignore', invalid='ignore'):
+        discriminant = b * b - 4 * a * c
+        root = np.sqrt(discriminant)
+        # numerically stable form, falls back to the linear root when a == 0
+        q = -(b + np.copysign(root, b)) / 2
+        first = np.where(a != 0, q / a, -c / b)
+        second = np.where(q != 0, c / q, first)
+        first = np.where(discriminant >= 0, first, np.nan)
+        second = np.where(discriminant >= 0, second, np.nan)
+    return first, second
+
+def _closest_approach(x0, x1, x2, y0, y1, y2, duration):
+    # minimum over t in [0, duration] of the squared distance to the origin of
+    # (x0 + x1*t + x2*t^2, y0 + y1*t + y2*t^2); the extremum lies at an end point or
+    # at a root of the cubic derivative, and evaluating the real part of every
+    # root only ever adds points that lie on the path
+    def squared_distance(t):
+        return (x0 + x1 * t + x2 * t ** 2) ** 2 + (y0 + y1 * t + y2 * t ** 2) ** 2
+
+    best = np.minimum(squared_distance(0.0), squared_distance(duration))
+
+    # half the derivative: c3*t^3 + c2*t^2 + c1*t + c0
+    c3 = 2 * (x2 * x2 + y2 * y2)
+    c2 = 3 * (x1 * x2 + y1 * y2)
+    c1 = x1 * x1 + y1 * y1 + 2 * (x0 * x2 + y0 * y2)
+    c0 = x0 * x1 + y0 * y1
+    for root in _cubic_roots(c3, c2, c1, c0):
+        t = np.clip(np.nan_to_num(root.real), 0, duration)
+        best = np.minimum(best, squared_distance(t))
+    return best
+
+def _cubic_roots(c3, c2, c1, c0):
+    # the three complex roots of a cubic with non-zero leading coefficient (Cardano)
+    a, b, c = c2 / c3, c1 / c3, c0 / c3
+    p = b - a * a / 3
+    q = 2 * a ** 3 / 27 - a * b / 3 + c
+    root = np.sqrt(np.asarray(q * q / 4 + p ** 3 / 27, dtype=complex))
+    w = np.where(np.abs(-q / 2 + root) >= np.abs(-q / 2 - root), -q / 2 + root, -q / 2 - root)
+    u = w ** (1 / 3)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v = np.where(u != 0, -p / (3 * u), 0)
+    rotation = complex(-0.5, np.sqrt(3) / 2)
+    return (u + v - a / 3,
+            u * rotation + v * rotation.conjugate() - a / 3,
+            u * rotation.conjugate() + v * rotation - a / 3)
@@ -0,0 +1,362 @@
+import math
+import numpy as np
+
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+
+import audio
+from action_mask import WALL_MARGIN
+from bounce_platform import platform_rects, rect_distance
+from game_env import make_observation_space, NUM_OBSERVED_PLATFORMS
+from trajectory import BallisticPath, sweep_hits_rects
+from settings import SCREEN_WIDTH, FPS, CAMERA_CENTER, INITIAL_X, INITIAL_Y, INITIAL_VELOCITY, BALL_RADIUS, GRAVITY, RESTITUTION, PLATFORM_LENGTH, PLATFORM_WIDTH
+
+NUM_ANGLES = 360
+FALL_TIME = 0.5
+
+class BuilderVecEnv(VecEnv):
+    """
+    N independent BuilderEnvironment episodes simulated together as
+    struct-of-arrays NumPy state, stepped, masked and observed in one batched
+    call per step.
+
+    The dynamics are those of the headless GameStateManager: time only
+    advances while the ball moves, a note pauses the ball until a valid angle
+    is chosen, and an episode ends when the song is over or no angle is left.
+    Finished episodes are reset automatically, as stable-baselines3 expects.
+
+    With macro_step every step is one note, like BuilderEnvironment(macro_step=True).
+    """
+    def __init__(self, num_envs, filepath='music/twinkle-twinkle-little-star.mid', rate=1, macro_step=False, songs=None):
+        self.render_mode = None
+        self.macro_step = macro_step
+        self.filepath = filepath
+        self.rate = rate
+        self.gravity = GRAVITY * rate
+
+        # note onsets of every env's song, padded with inf; with a SongSampler
+        # each episode gets its own song, otherwise all play filepath
+        self.songs = songs
+        onsets = audio.create_global_event_queue(filepath).with_rate(rate).times if songs is None else np.zeros(0)
+        num_notes = len(onsets)
+        self.onsets = np.tile(np.append(onsets, np.inf), (num_envs, 1))
+        self.num_notes = np.full(num_envs, num_notes)
+
+        # ball
+        self.position = np.zeros((num_envs, 2))
+        self.velocity = np.zeros((num_envs, 2))
+        self.prev_velocity = np.zeros((num_envs, 2))
+        self.paused = np.zeros(num_envs, dtype=bool)
+        self.need_action = np.zeros(num_envs, dtype=bool)
+        self.vertical_offset = np.zeros(num_envs)
+
+        # frames the ball has moved since the song started, and the next note
+        self.frames = np.zeros(num_envs, dtype=int)
+        self.cursor = np.zeros(num_envs, dtype=int)
+        self.action_mask = np.ones((num_envs, NUM_ANGLES), dtype=np.int8)
+
+        # platforms: where each was attached (the observed position), and for
+        # placed ones the rectangle (center, normal, tangent, length, width) and bounds
+        self.platform_count = np.zeros(num_envs, dtype=int)
+        self.placed_count = np.zeros(num_envs, dtype=int)
+        self.platform_anchors = np.zeros((num_envs, num_notes + 1, 2))
+        self.platform_rects = np.zeros((num_envs, num_notes + 1, 8))
+        self.platform_bounds = np.zeros((num_envs, num_notes + 1, 4))
+
+        # ball trail for the new-platform-vs-history check
+        self.trail = np.zeros((num_envs, 1024, 2))
+        self.trail_count = np.zeros(num_envs, dtype=int)
+
+        self._fall_trail, self._fall_position, self._fall_velocity = self._simulate_fall()
+        self._actions = np.zeros(num_envs, dtype=int)
+
+        super().__init__(num_envs, make_observation_space(), spaces.Discrete(NUM_ANGLES))
+
+    def _simulate_fall(self):
+        # the initial fall is the same for every episode, run it once
+        position = [INITIAL_X, INITIAL_Y]
+        velocity = list(INITIAL_VELOCITY)
+        trail = []
+        frames = 0
+        while frames / FPS < FALL_TIME:
+            trail.append(tuple(position))
+            position[0] += velocity[0]
+            position[1] += velocity[1]
+            velocity[1] -= self.gravity
+            frames += 1
+        return np.array(trail), np.array(position), np.array(velocity)
+
+    def _set_song(self, i, schedule):
+        num_notes = len(schedule)
+        if num_notes + 1 > self.onsets.shape[1]:
+            # room for the longest song so far
+            grow = num_notes + 1 - self.onsets.shape[1]
+            self.onsets = np.pad(self.onsets, ((0, 0), (0, grow)), constant_values=np.inf)
+            self.platform_anchors = np.pad(self.platform_anchors, ((0, 0), (0, grow), (0, 0)))
+            self.platform_rects = np.pad(self.platform_rects, ((0, 0), (0, grow), (0, 0)))
+            self.platform_bounds = np.pad(self.platform_bounds, ((0, 0), (0, grow), (0, 0)))
+        self.onsets[i] = np.inf
+        self.onsets[i, :num_notes] = schedule.with_rate(self.rate).times
+        self.num_notes[i] = num_notes
+
+    def _reset_envs(self, ids):
+        if self.songs is not None:
+            for i in ids:
+                self._set_song(i, self.songs.sample()[1])
+
+        self.position[ids] = self._fall_position
+        self.velocity[ids] = self._fall_velocity
+        self.prev_velocity[ids] = 0
+        self.paused[ids] = False
+        self.need_action[ids] = False
+        self.vertical_offset[ids] = self._fall_position[1] - CAMERA_CENTER
+        self.frames[ids] = 0
+        self.cursor[ids] = 0
+        self.action_mask[ids] = 1
+        self.platform_count[ids] = 0
+        self.placed_count[ids] = 0
+        self.trail[ids, :len(self._fall_trail)] = self._fall_trail
+        self.trail_count[ids] = len(self._fall_trail)
+
+        if self.macro_step:
+            # fall on to the first note
+            running = np.zeros(self.num_envs, dtype=bool)
+            running[ids] = True
+            while running.any():
+                _, terminated, _, deciding = self._frame(None, running)
+                running &= ~terminated & ~deciding
+
+    def reset(self):
+        self._reset_envs(np.arange(self.num_envs))
+        self.reset_infos = [{"action_mask": mask} for mask in self.action_masks()]
+        return self._get_obs()
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions, dtype=int).reshape(self.num_envs)
+
+    def step_wait(self):
+        live = np.ones(self.num_envs, dtype=bool)
+        rewards, terminated, completed, _ = self._frame(self._actions, live)
+
+        if self.macro_step:
+            # run every placed ball on to its next note; the frame that pauses
+            # on the note is rewarded with the step that answers it
+            running = ~terminated & ~self.paused
+            while running.any():
+                frame_rewards, frame_terminated, frame_completed, deciding = self._frame(None, running)
+                counted = running & ~deciding
+                rewards[counted] += frame_rewards[counted]
+                terminated |= frame_terminated
+                completed |= frame_completed
+                running &= ~frame_terminated & ~deciding
+
+        observations = self._get_obs()
+        infos = [{} for _ in range(self.num_envs)]
+        done = np.nonzero(terminated)[0]
+        if len(done):
+            for i in done:
+                infos[i]["terminal_observation"] = {key: value[i].copy() for key, value in observations.items()}
+                infos[i]["TimeLimit.truncated"] = False
+            self._reset_envs(done)
+            for key, value in self._get_obs(done).items():
+                observations[key][done] = value
+
+        masks = self.action_masks()
+        for i in range(self.num_envs):
+            infos[i]["action_mask"] = masks[i]
+
+        return observations, rewards.astype(np.float32), terminated, infos
+
+    def action_masks(self):
+        # (num_envs, 360) allowed angles; envs not paused on a note ignore
+        # their action, so every angle is allowed for them
+        return np.where(self.paused[:, None], self.action_mask, 1).astype(bool)
+
+    def _frame(self, actions, live):
+        """
+        One frame of GameStateManager.step for the envs in the live mask.
+
+        With actions None the envs that pause on a note stop there without an
+        action being applied, as GameStateManager.step(None) does.
+
+        :return: (rewards, terminated, completed, deciding) arrays over all envs,
+                 deciding marks the live envs paused on a note and not terminated.
+        """
+        envs = np.arange(self.num_envs)
+
+        # the song is over
+        completed = live & (self.cursor >= self.num_notes)
+        terminated = completed.copy()
+        active = live & ~completed
+
+        # record the ball while it moves, then look at the next note
+        self._record_trail(active & ~self.paused)
+        self.vertical_offset[active] = self.position[active, 1] - CAMERA_CENTER
+        onset = self.onsets[envs, np.minimum(self.cursor, self.num_notes - 1)]
+        triggered = active & ((onset <= self.frames / FPS) | self.need_action)
+
+        # pause on a new note and work out which angles are allowed
+        new_pause = np.nonzero(triggered & ~self.paused)[0]
+        if len(new_pause):
+            self.prev_velocity[new_pause] = self.velocity[new_pause]
+            self.velocity[new_pause] = 0
+            self.paused[new_pause] = True
+            self.platform_anchors[new_pause, self.platform_count[new_pause]] = self.position[new_pause]
+            self.platform_count[new_pause] += 1
+            self.action_mask[new_pause] = self._compute_masks(new_pause)
+            terminated[new_pause[self.action_mask[new_pause].sum(axis=1) == 0]] = True
+
+        deciding = triggered & ~terminated
+        if actions is not None:
+            valid = deciding & (self.action_mask[envs, actions % NUM_ANGLES] == 1)
+            self.need_action[live] = (deciding & ~valid)[live]
+            self._place_platforms(np.nonzero(valid)[0], actions)
+
+        # move every ball that is running
+        moving = active & ~terminated & ~self.paused
+        self.position[moving] += self.velocity[moving]
+        self.velocity[moving, 1] -= self.gravity
+        self.frames[moving] += 1
+
+        rewards = self.platform_count - self.vertical_offset / 10
+        rewards = np.where(terminated & completed, rewards * 2, np.where(terminated, rewards * 0.5, rewards))
+        return np.where(live, rewards, 0), terminated, completed, deciding
+
+    def _record_trail(self, recording):
+        ids = np.nonzero(recording)[0]
+        if len(ids) == 0:
+            return
+        if self.trail_count[ids].max() >= self.trail.shape[1]:
+            self.trail = np.concatenate([self.trail, np.zeros_like(self.trail)], axis=1)
+        self.trail[ids, self.trail_count[ids]] = self.position[ids]
+        self.trail_count[ids] += 1
+
+    def _place_platforms(self, ids, actions):
+        if len(ids) == 0:
+            return
+        angles = actions[ids] % NUM_ANGLES
+        slots = self.placed_count[ids]
+
+        anchors = self.platform_anchors[ids, slots]
+        centers, normals, tangents = platform_rects(anchors[:, 0], anchors[:, 1], angles, BALL_RADIUS, PLATFORM_LENGTH, PLATFORM_WIDTH)
+        extent = np.abs(normals) * PLATFORM_WIDTH / 2 + np.abs(tangents) * PLATFORM_LENGTH / 2
+        self.platform_rects[ids, slots] = np.concatenate([centers, normals, tangents, np.full((len(ids), 1), PLATFORM_LENGTH), np.full((len(ids), 1), PLATFORM_WIDTH)], axis=1)
+        self.platform_bounds[ids, slots] = np.concatenate([centers - extent, centers + extent], axis=1)
+        self.placed_count[ids] += 1
+        self.cursor[ids] += 1
+
+        # resume and bounce, as Ball.resume and Ball.bounce_off_platform
+        self.paused[ids] = False
+        velocity = self.prev_velocity[ids]
+        velocity_angle_rad = np.arctan2(-velocity[:, 1], velocity[:, 0])
+        reflection_angle_rad = 2 * np.radians(angles) - velocity_angle_rad
+        speed = np.hypot(velocity[:, 0], velocity[:, 1]) * RESTITUTION
+        self.velocity[ids] = np.stack([-speed * np.cos(reflection_angle_rad), speed * np.sin(reflection_angle_rad)], axis=1)
+
+    def _compute_masks(self, ids):
+        """
+        Action masks for the paused envs ids, all at once; the same checks as
+        action_mask.compute_action_mask at whole-degree angles.
+        """
+        forbidden = np.zeros((len(ids), NUM_ANGLES), dtype=bool)
+        origin = self.position[ids]
+        angles = np.arange(NUM_ANGLES)
+
+        # every bounce of every env, as in Ball.bounce_velocity
+        prev = self.prev_velocity[ids]
+        incoming = np.arctan2(-prev[:, 1], prev[:, 0])
+        speed = np.hypot(prev[:, 0], prev[:, 1]) * RESTITUTION
+        reflection = 2 * np.radians(angles)[None, :] - incoming[:, None]
+        velocity = np.stack([-speed[:, None] * np.cos(reflection), speed[:, None] * np.sin(reflection)], axis=-1)
+
+        has_next = self.cursor[ids] + 1 < self.num_notes[ids]
+        following = np.minimum(self.cursor[ids] + 1, self.num_notes[ids] - 1)
+        duration = np.where(has_next, (self.onsets[ids, following] - self.onsets[ids, self.cursor[ids]]) * FPS, 0)
+        paths = BallisticPath.from_frame_steps(origin[:, None, :], velocity, self.gravity, duration[:, None])
+
+        # screen edges
+        min_x, max_x = paths.x_range()
+        forbidden |= has_next[:, None] & ((min_x < WALL_MARGIN) | (max_x > SCREEN_WIDTH - WALL_MARGIN))
+
+        # placed platforms: envs' platforms near any of their paths, then only
+        # the (angle, platform) pairs whose bounding boxes overlap
+        placed = self.placed_count[ids]
+        if has_next.any() and placed.max() > 0:
+            bounds = paths.bounds()
+            bounds[..., :2] -= BALL_RADIUS
+            bounds[..., 2:] += BALL_RADIUS
+            union = np.concatenate([bounds[..., :2].min(axis=1), bounds[..., 2:].max(axis=1)], axis=1)
+            platform_bounds = self.platform_bounds[ids, :placed.max()]
+            near = ((np.arange(placed.max()) < placed[:, None]) & has_next[:, None] & _overlaps(union[:, None], platform_bounds))
+            env_ids, platform_ids = np.nonzero(near)
+            if len(env_ids):
+                pair_ids, angle_ids = np.nonzero(_overlaps(bounds[env_ids], platform_bounds[env_ids, platform_ids][:, None]))
+                env_ids, platform_ids = env_ids[pair_ids], platform_ids[pair_ids]
+                rects = self.platform_rects[ids[env_ids], platform_ids]
+                hits = sweep_hits_rects(paths.origin[env_ids, 0], paths.velocity[env_ids, angle_ids], paths.acceleration, paths.duration[env_ids, 0],
+                                        rects[:, 0:2], rects[:, 2:4], rects[:, 4:6], rects[:, 6], rects[:, 7], BALL_RADIUS)
+                forbidden[env_ids[hits], angle_ids[hits]] = True
+
+        # earlier ball positions within reach of the new platform
+        reach = math.hypot(BALL_RADIUS + PLATFORM_WIDTH, PLATFORM_LENGTH / 2) + BALL_RADIUS
+        counts = self.trail_count[ids]
+        history = self.trail[ids, :counts.max()]
+        offsets = history - origin[:, None, :]
+        near = (np.arange(counts.max()) < counts[:, None] - 1) & (np.einsum('ijk,ijk->ij', offsets, offsets) <= reach * reach)
+        env_ids, sample_ids = np.nonzero(near)
+        if len(env_ids):
+            centers, normals, tangents = platform_rects(origin[env_ids, 0][:, None], origin[env_ids, 1][:, None], angles[None, :],
+                                                        BALL_RADIUS, PLATFORM_LENGTH, PLATFORM_WIDTH)
+            distances = rect_distance(history[env_ids, sample_ids][:, None, :], centers, normals, tangents, PLATFORM_LENGTH, PLATFORM_WIDTH)
+            np.logical_or.at(forbidden, env_ids, distances <= BALL_RADIUS)
+
+        return (~forbidden).astype(np.int8)
+
+    def _get_obs(self, ids=None):
+        if ids is None:
+            ids = np.arange(self.num_envs)
+
+        # the last 25 platforms, oldest first, zero padded at the end
+        counts = self.platform_count[ids]
+        first = np.maximum(counts - NUM_OBSERVED_PLATFORMS, 0)
+        slots = first[:, None] + np.arange(NUM_OBSERVED_PLATFORMS)
+        shown = np.arange(NUM_OBSERVED_PLATFORMS) < np.minimum(counts, NUM_OBSERVED_PLATFORMS)[:, None]
+        slots = np.minimum(slots, self.platform_anchors.shape[1] - 1)
+        platforms = np.where(shown[..., None], self.platform_anchors[ids[:, None], slots], 0).astype(np.float32)
+
+        return {
+            "agent": self.position[ids].copy(),
+            "platforms": platforms,
+            "velocity": self.velocity[ids].copy(),
+        }
+
+    def close(self):
+        if self.songs is not None:
+            self.songs.close()
+
+    def _indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+        return indices
+
+    def get_attr(self, attr_name, indices=None):
+        value = getattr(self, attr_name)
+        return [value for _ in self._indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        # batch methods are called once and their per-env rows handed out
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        return [result[i] for i in self._indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._indices(indices)]
+
+def _overlaps(a, b):
+    # boxes as (min_x, min_y, max_x, max_y), broadcasting
+    return ((a[..., 0] <= b[..., 2]) & (a[..., 2] >= b[..., 0]) &
+            (a[..., 1] <= b[..., 3]) & (a[..., 3] >= b[..., 1]))
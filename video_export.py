@@ -0,0 +1,100 @@
+import argparse
+import multiprocessing as mp
+import os
+
+import pygame
+
+from replay import Replay
+from settings import SCREEN_WIDTH, SCREEN_HEIGHT, CAMERA_CENTER, FPS
+
+# 'raw' writes every frame as packed rgb24 into one file, the others save
+# numbered images into a directory
+FORMATS = ('raw', 'png', 'bmp', 'tga')
+
+def render_frames(state_manager, surface):
+    """
+    Draw the recorded run one frame at a time onto surface, as init_playback
+    shows it: one frame per row of the frame record, the camera following the
+    ball and every platform on screen. Nothing waits on the clock, so frames
+    come as fast as they are drawn.
+
+    Moves state_manager's ball, play the run before exporting it.
+
+    :return: Generator yielding surface after each frame is drawn.
+    """
+    ball = state_manager.ball
+    renderer = state_manager.renderer
+    positions = state_manager.frame_data.positions()
+    for x, y in positions.tolist():
+        ball.x, ball.y = x, y
+        renderer.render(surface, ball, state_manager.platforms, y - CAMERA_CENTER)
+        yield surface
+
+def export(state_manager, output, image_format='raw'):
+    """
+    Render a finished run to disk. Only one frame is held in memory at a time.
+
+    :param output: File for 'raw', directory for image formats (created if needed).
+    :return: Number of frames written.
+    """
+    if image_format not in FORMATS:
+        raise ValueError("image_format must be one of {}".format(", ".join(FORMATS)))
+    surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+
+    count = 0
+    if image_format == 'raw':
+        with open(output, 'wb') as f:
+            for frame in render_frames(state_manager, surface):
+                f.write(pygame.image.tobytes(frame, 'RGB'))
+                count += 1
+    else:
+        os.makedirs(output, exist_ok=True)
+        for frame in render_frames(state_manager, surface):
+            pygame.image.save(frame, os.path.join(output, "frame_{:06d}.{}".format(count, image_format)))
+            count += 1
+    return count
+
+def export_replay(job):
+    # one pool job: simulate the replay again and render it
+    replay_path, output, image_format = job
+    return export(Replay.load(replay_path).simulate(), output, image_format)
+
+def export_replays(replay_paths, output_dir, image_format='raw', workers=None):
+    """
+    Export many replays at once, one per process. Each goes to output_dir under
+    its file name, with a .rgb extension for 'raw'.
+
+    :param workers: Pool size, the number of cores by default; 1 exports in this process.
+    :return: List of (output path, frames written).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    for path in replay_paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        if image_format == 'raw':
+            name += '.rgb'
+        jobs.append((path, os.path.join(output_dir, name), image_format))
+
+    if workers is None:
+        workers = mp.cpu_count()
+    workers = min(workers, len(jobs))
+    if workers > 1:
+        with mp.get_context("spawn").Pool(workers) as pool:
+            counts = pool.map(export_replay, jobs, chunksize=1)
+    else:
+        counts = [export_replay(job) for job in jobs]
+    return [(job[1], count) for job, count in zip(jobs, counts)]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render replays to video frames without a window.")
+    parser.add_argument('replays', nargs='+')
+    parser.add_argument('--out', default='videos')
+    parser.add_argument('--format', choices=FORMATS, default='raw')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    for output, count in export_replays(args.replays, args.out, args.format, args.workers):
+        print("{}: {} frames".format(output, count))
+    if args.format == 'raw':
+        print("encode with: ffmpeg -f rawvideo -pix_fmt rgb24 -s {}x{} -r {} -i FILE.rgb FILE.mp4".format(
+            SCREEN_WIDTH, SCREEN_HEIGHT, FPS))